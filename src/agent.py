@@ -1,5 +1,6 @@
 from abc import ABC, abstractmethod
 from pygame import K_UP, K_LEFT, K_RIGHT, K_DOWN
+import numpy as np
 
 
 class Agent(ABC):
@@ -53,15 +54,33 @@ class Agent(ABC):
         """
         pass
 
+    def close(self):
+        """
+        - Release anything the agent holds on to (threads, processes, ...)
+        :return: None
+        """
+        pass
+
 
 class DefaultAgent(Agent):
 
     def __init__(self, input_shape: tuple[int, int], num_outputs: int):
         super().__init__(input_shape, num_outputs, training=False)
+        self._input_queue = None
+
+    def set_input_queue(self, input_queue):
+        """
+        - Take one queued turn per step (see controls.InputQueue) instead of polling the
+          keys held down at the time of the step
+        """
+        self._input_queue = input_queue
 
     def update(
         self, inputs, reward_collision=False, wall_collision=False, keys_pressed=None
     ):
+        if self._input_queue is not None:
+            direction = self._input_queue.pop()
+            return 4 if direction is None else direction
         if keys_pressed[K_LEFT]:
             return 0
         if keys_pressed[K_UP]:
@@ -77,3 +96,27 @@ class DefaultAgent(Agent):
 
     def load_model(self, path):
         pass
+
+
+class RandomAgent(Agent):
+
+    def __init__(
+        self, input_shape: tuple[int, int], num_outputs: int, seed: int | None = None
+    ):
+        """
+        - Picks a uniformly random direction every step, a baseline and a cheap stand-in
+          agent (e.g. for remote.RemoteAgent)
+        """
+        super().__init__(input_shape, num_outputs, training=False)
+        self.rng = np.random.RandomState(seed)
+
+    def update(
+        self, inputs, reward_collision=False, wall_collision=False, keys_pressed=None
+    ):
+        return int(self.rng.randint(self.num_outputs))
+
+    def save_model(self, path):
+        pass
+
+    def load_model(self, path):
+        pass
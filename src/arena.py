@@ -0,0 +1,240 @@
+from constants import FOOD_COLOR, SNAKE_COLOR
+import numpy as np
+import logging
+
+log = logging.getLogger(__name__)
+
+WALL = -1
+EMPTY = 0
+
+
+class Arena:
+
+    def __init__(
+        self,
+        width,
+        height,
+        num_snakes,
+        num_food,
+        view_radius=5,
+        max_length=64,
+        wall_collision_value=-20,
+        snake_collision_value=-20,
+        reward_collision_value=20,
+        other_value=-2,
+    ):
+        """
+        - Many snakes and many food items on one board, all stepped at the same time
+        - The occupancy grid is padded with WALL cells and holds snake id + 1 for body
+          cells, so collisions and observations are plain array lookups
+        - Bodies are ring buffers of flat grid indices: a step touches the heads, the tails
+          and the cells of snakes that died, never the whole board
+        :param width: cells across
+        :param height: cells upwards
+        :param num_snakes: number of snakes, each one respawns as soon as it dies
+        :param num_food: number of food items kept on the board
+        :param view_radius: observations are (2r + 1) x (2r + 1) windows around each head
+        :param max_length: initial ring buffer capacity, doubled when a snake outgrows it
+        """
+        self.width = width
+        self.height = height
+        self.num_snakes = num_snakes
+        self.num_food = num_food
+        self.view_radius = view_radius
+        # rewards, same defaults as QLearningParams
+        self.wall_collision_value = wall_collision_value
+        self.snake_collision_value = snake_collision_value
+        self.reward_collision_value = reward_collision_value
+        self.other_value = other_value
+        # padded grid, flat index = (x + pad) * padded_height + (y + pad)
+        self._pad = max(1, view_radius)
+        self._padded_height = height + 2 * self._pad
+        self._occupancy = np.full(
+            (width + 2 * self._pad) * self._padded_height, WALL, dtype=np.int32
+        )
+        self._food = np.zeros(self._occupancy.shape, dtype=bool)
+        # left, up, right, down (same order as Snake.get_direction)
+        self._deltas = np.array([-self._padded_height, -1, self._padded_height, 1])
+        view = np.arange(-view_radius, view_radius + 1)
+        self._view_offsets = (
+            view[:, None] * self._padded_height + view[None, :]
+        ).ravel()
+        self._ids = np.arange(num_snakes)
+        # per snake state
+        self.heads = np.zeros(num_snakes, dtype=np.int64)
+        self.directions = np.zeros(num_snakes, dtype=np.int64)
+        self.lengths = np.zeros(num_snakes, dtype=np.int64)
+        self._bodies = np.zeros((num_snakes, max_length), dtype=np.int64)
+        self._ptr = np.zeros(num_snakes, dtype=np.int64)
+        # stats
+        self.high_score = 0
+        self.scores = []
+        self.reset()
+
+    def reset(self):
+        interior = self._interior()
+        self._occupancy[:] = WALL
+        self._occupancy[interior] = EMPTY
+        self._food[:] = False
+        self.lengths[:] = 0
+        self._spawn(self._ids)
+        self._place_food(self.num_food)
+        return self.observe()
+
+    def step(self, actions):
+        """
+        - Move every snake one cell at once
+        - Tails move out of the way before collisions are checked, heads that land on the
+          same cell or swap cells head on all die, and dead snakes respawn with length 1
+        :param actions: int array (num_snakes,), 0 - 3 like Snake.get_direction, 4 = keep going
+        :return: (observations, rewards, dones)
+        """
+        actions = np.asarray(actions)
+        self.directions = np.where(actions == 4, self.directions, actions)
+        new_heads = self.heads + self._deltas[self.directions]
+        capacity = self._bodies.shape[1]
+        tails = self._bodies[self._ids, (self._ptr - self.lengths + 1) % capacity]
+        wall = self._occupancy[new_heads] == WALL
+        eats = self._food[new_heads]
+        # snakes moving into each other's heads collide head on, even when both heads
+        # are also tails that are about to be freed (length 1)
+        owners = self._occupancy[new_heads] - 1
+        facing = np.flatnonzero(owners >= 0)
+        others = owners[facing]
+        swapped = np.zeros(self.num_snakes, dtype=bool)
+        swapped[facing] = (
+            (others != facing)
+            & (new_heads[facing] == self.heads[others])
+            & (new_heads[others] == self.heads[facing])
+        )
+        # snakes that do not grow free their tail cell this step
+        self._occupancy[tails[~eats]] = EMPTY
+        _, inverse, counts = np.unique(
+            new_heads, return_inverse=True, return_counts=True
+        )
+        dead = (self._occupancy[new_heads] != EMPTY) | (counts[inverse] > 1) | swapped
+        alive = ~dead
+        eats &= alive
+        # rewards
+        rewards = np.full(self.num_snakes, self.other_value, dtype=np.float32)
+        rewards[eats] = self.reward_collision_value
+        rewards[dead & wall] = self.wall_collision_value
+        rewards[dead & ~wall] = self.snake_collision_value
+        # remove the dead before the survivors claim their new cells
+        dead_ids = np.flatnonzero(dead)
+        self._clear(dead_ids)
+        if np.any(self.lengths + eats > capacity):
+            self._grow()
+            capacity = self._bodies.shape[1]
+        alive_ids = np.flatnonzero(alive)
+        self._ptr[alive_ids] = (self._ptr[alive_ids] + 1) % capacity
+        self._bodies[alive_ids, self._ptr[alive_ids]] = new_heads[alive_ids]
+        self._occupancy[new_heads[alive_ids]] = alive_ids + 1
+        self.heads[alive_ids] = new_heads[alive_ids]
+        self.lengths += eats
+        self._food[new_heads[eats]] = False
+        # bookkeeping
+        if len(dead_ids):
+            scores = self.lengths[dead_ids]
+            self.scores.extend(scores.tolist())
+            self.high_score = max(self.high_score, int(scores.max()))
+            self._spawn(dead_ids)
+        self._place_food(int(eats.sum()))
+        return self.observe(), rewards, dead
+
+    def observe(self):
+        """
+        - Egocentric windows around every head, indexed [snake, x, y, channel]
+        - Channels: own body, obstacles (other snakes and walls), food
+        :return: float32 array (num_snakes, 2r + 1, 2r + 1, 3)
+        """
+        size = 2 * self.view_radius + 1
+        cells = self.heads[:, None] + self._view_offsets
+        occupancy = self._occupancy[cells]
+        own = occupancy == (self._ids + 1)[:, None]
+        obstacles = (occupancy != EMPTY) & ~own
+        observations = np.stack([own, obstacles, self._food[cells]], axis=-1)
+        return observations.astype(np.float32).reshape(self.num_snakes, size, size, 3)
+
+    def to_board(self):
+        """
+        - Board in the SimulatorModel format (width, height, 1), e.g. for gui.components.Board
+        """
+        pad = self._pad
+        shape = (self.width + 2 * pad, self._padded_height)
+        occupancy = self._occupancy.reshape(shape)[pad:-pad, pad:-pad]
+        food = self._food.reshape(shape)[pad:-pad, pad:-pad]
+        board = np.zeros((self.width, self.height, 1))
+        board[occupancy > 0] = SNAKE_COLOR
+        board[food] = FOOD_COLOR
+        return board
+
+    def _interior(self):
+        xs = np.arange(self.width) + self._pad
+        ys = np.arange(self.height) + self._pad
+        return (xs[:, None] * self._padded_height + ys[None, :]).ravel()
+
+    def _random_free_cells(self, count):
+        """
+        - Rejection sample distinct cells that hold neither a snake nor food
+        - Falls back to scanning the board only when it is nearly full
+        """
+        chosen = np.zeros(0, dtype=np.int64)
+        for _ in range(32):
+            need = count - len(chosen)
+            if need <= 0:
+                return chosen[:count]
+            xs = np.random.randint(0, self.width, size=2 * need + 8)
+            ys = np.random.randint(0, self.height, size=2 * need + 8)
+            cells = (xs + self._pad) * self._padded_height + ys + self._pad
+            cells = cells[(self._occupancy[cells] == EMPTY) & ~self._food[cells]]
+            cells = cells[~np.isin(cells, chosen)]
+            _, first = np.unique(cells, return_index=True)
+            chosen = np.concatenate([chosen, cells[np.sort(first)]])
+        interior = self._interior()
+        free = interior[(self._occupancy[interior] == EMPTY) & ~self._food[interior]]
+        free = free[~np.isin(free, chosen)]
+        need = count - len(chosen)
+        assert need <= len(free), "Not enough free cells left on the board"
+        return np.concatenate([chosen, np.random.permutation(free)[:need]])
+
+    def _spawn(self, ids):
+        cells = self._random_free_cells(len(ids))
+        self.heads[ids] = cells
+        self.directions[ids] = np.random.randint(0, 4, size=len(ids))
+        self.lengths[ids] = 1
+        self._ptr[ids] = 0
+        self._bodies[ids, 0] = cells
+        self._occupancy[cells] = ids + 1
+
+    def _place_food(self, count):
+        if count > 0:
+            self._food[self._random_free_cells(count)] = True
+
+    def _clear(self, ids):
+        """
+        - Free every cell still owned by the given snakes
+        """
+        if len(ids) == 0:
+            return
+        capacity = self._bodies.shape[1]
+        slots = (self._ptr[ids, None] - np.arange(capacity)) % capacity
+        cells = self._bodies[ids[:, None], slots]
+        valid = np.arange(capacity) < self.lengths[ids, None]
+        owners = np.broadcast_to(ids[:, None] + 1, cells.shape)[valid]
+        cells = cells[valid]
+        self._occupancy[cells[self._occupancy[cells] == owners]] = EMPTY
+
+    def _grow(self):
+        """
+        - Double the ring buffer capacity, unrolling each body so its tail sits at slot 0
+        """
+        capacity = self._bodies.shape[1]
+        slots = (
+            self._ptr[:, None] - self.lengths[:, None] + 1 + np.arange(capacity)
+        ) % capacity
+        bodies = np.zeros((self.num_snakes, 2 * capacity), dtype=np.int64)
+        bodies[:, :capacity] = np.take_along_axis(self._bodies, slots, axis=1)
+        self._bodies = bodies
+        self._ptr = np.maximum(self.lengths - 1, 0)
+        log.debug(f"Arena body capacity grown to {2 * capacity}")
@@ -0,0 +1,309 @@
+from qlearn import QLearningAgent
+from simulator import SimulatorModel
+import tensorflow as tf
+import numpy as np
+import multiprocessing
+import queue
+import json
+import time
+import os
+import logging
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, memory is then not measured
+    resource = None
+
+log = logging.getLogger(__name__)
+
+DEFAULT_CONFIG_PATH = "autotune.json"
+# knobs in the order they are tuned, num_games last as it multiplies memory use
+KNOBS = (
+    "intra_op_threads",
+    "inter_op_threads",
+    "batch_size",
+    "train_every",
+    "num_games",
+)
+# trial agents never save or stream their weights anywhere
+_TRIAL_OVERRIDES = {
+    "training_model": True,
+    "save_after": None,
+    "load_latest_model": False,
+    "remote_learner": False,
+    "train_each_step": False,
+}
+
+
+def default_search_space(batch_size=64, train_every=None):
+    """
+    - Candidate values of every knob, the first value of each is the starting point
+    - 0 threads means TensorFlow's default, train_every None means training only at
+      the end of each episode
+    :param batch_size: current batch size
+    :param train_every: current train_every
+    """
+    cpus = os.cpu_count() or 1
+    threads = sorted({1, 2, max(cpus // 2, 1), cpus})
+    return {
+        "intra_op_threads": [0] + threads,
+        "inter_op_threads": [0, 1, 2],
+        "batch_size": [batch_size] + [b for b in (32, 64, 128, 256) if b != batch_size],
+        "train_every": [train_every]
+        + [n for n in (None, 1, 4, 16) if n != train_every],
+        "num_games": sorted({1, 2, max(cpus // 2, 1)}),
+    }
+
+
+def default_memory_budget_mb():
+    """
+    - Half of the physical memory, None when it cannot be found out
+    """
+    try:
+        total = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        return None
+    return total / 2**20 / 2
+
+
+def apply_thread_settings(settings):
+    """
+    - Must run before TensorFlow executes its first operation
+    """
+    tf.config.threading.set_intra_op_parallelism_threads(settings["intra_op_threads"])
+    tf.config.threading.set_inter_op_parallelism_threads(settings["inter_op_threads"])
+
+
+def _peak_memory_mb():
+    if resource is None:
+        return None
+    # kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _trial_worker(
+    agent_kwargs, settings, width, height, seconds, warmup_steps, seed, barrier, results
+):
+    """
+    - One headless game in its own process: warm up (model tracing, first fits), wait
+      for the other games of the trial, then count steps and updates for seconds
+    """
+    try:
+        apply_thread_settings(settings)
+        np.random.seed(seed)
+        agent = QLearningAgent(
+            **{
+                **agent_kwargs,
+                **_TRIAL_OVERRIDES,
+                "batch_size": settings["batch_size"],
+                "train_every": settings["train_every"],
+            }
+        )
+        model = SimulatorModel(
+            width, height, agent=agent, max_iterations=None, debug=False
+        )
+        agent.set_simulator(simulator=model)
+        for _ in range(warmup_steps):
+            model.update_state(keys_pressed=None)
+        # games still starting up get a few minutes to catch up
+        barrier.wait(timeout=300)
+        steps, updates = 0, agent.updates
+        start = time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            model.update_state(keys_pressed=None)
+            steps += 1
+        elapsed = time.perf_counter() - start
+        agent.close()
+        results.put(
+            {
+                "steps": steps,
+                "updates": agent.updates - updates,
+                "seconds": elapsed,
+                "memory_mb": _peak_memory_mb(),
+            }
+        )
+    except Exception as e:
+        barrier.abort()
+        results.put({"error": repr(e)})
+
+
+def run_trial(agent_kwargs, settings, width, height, seconds=5.0, warmup_steps=100):
+    """
+    - Run settings["num_games"] games side by side, each in a fresh process so the
+      thread settings apply
+    - Collection (environment steps) and training (updates, and the transitions they
+      train on, updates * batch_size) are reported separately
+    :return: metrics, with "error" set if any game failed
+    """
+    context = multiprocessing.get_context("spawn")
+    num_games = settings["num_games"]
+    barrier = context.Barrier(num_games)
+    results = context.Queue()
+    processes = [
+        context.Process(
+            target=_trial_worker,
+            args=(
+                agent_kwargs,
+                settings,
+                width,
+                height,
+                seconds,
+                warmup_steps,
+                seed,
+                barrier,
+                results,
+            ),
+            daemon=True,
+        )
+        for seed in range(num_games)
+    ]
+    for process in processes:
+        process.start()
+    games = []
+    try:
+        for _ in processes:
+            # a crashed process never reports back
+            games.append(results.get(timeout=seconds + 300))
+    except queue.Empty:
+        games.append({"error": "a game did not report back"})
+    for process in processes:
+        process.join(timeout=10)
+        if process.is_alive():
+            process.terminate()
+    errors = [game["error"] for game in games if "error" in game]
+    if errors:
+        return {"error": errors[0]}
+    steps_per_second = sum(game["steps"] / game["seconds"] for game in games)
+    updates_per_second = sum(game["updates"] / game["seconds"] for game in games)
+    memory = [game["memory_mb"] for game in games]
+    return {
+        "steps_per_second": steps_per_second,
+        "updates_per_second": updates_per_second,
+        "trained_per_second": updates_per_second * settings["batch_size"],
+        "memory_mb": None if None in memory else sum(memory),
+    }
+
+
+def autotune(
+    agent_kwargs,
+    width,
+    height,
+    path=DEFAULT_CONFIG_PATH,
+    trial_seconds=5.0,
+    memory_budget_mb=None,
+    search_space=None,
+    warmup_steps=100,
+    min_steps_fraction=0.5,
+):
+    """
+    - Tune one knob at a time (coordinate descent): try each candidate value with the
+      other knobs at their best values so far and keep the one training on the most
+      transitions per second, rejecting trials that go over the memory budget
+    - Trials must also keep collecting at least min_steps_fraction of the starting
+      point's environment steps per second, otherwise large batches or frequent training
+      win by starving the replay memory of new experience
+    - Every distinct configuration runs once, the starting point is today's settings
+    - The chosen settings are written to a JSON config file, see load_config
+    :param agent_kwargs: QLearningAgent keyword arguments the trials start from
+    :param width: board cells across
+    :param height: board cells upwards
+    :param path: where to write the config
+    :param trial_seconds: measured seconds per trial, after warm up
+    :param memory_budget_mb: peak resident memory of all games of a trial, defaults to
+      half of the physical memory
+    :param search_space: candidate values per knob, see default_search_space
+    :param warmup_steps: unmeasured steps per game before each trial
+    :param min_steps_fraction: lowest accepted steps per second, relative to the
+      starting point
+    :return: the chosen settings
+    """
+    space = search_space or default_search_space(
+        agent_kwargs.get("batch_size", 64), agent_kwargs.get("train_every")
+    )
+    if memory_budget_mb is None:
+        memory_budget_mb = default_memory_budget_mb()
+    best = {knob: space[knob][0] for knob in KNOBS}
+    trials = {}
+
+    def measure(settings):
+        key = tuple(settings[knob] for knob in KNOBS)
+        if key not in trials:
+            log.info(f"Trial {len(trials) + 1}: {settings}")
+            metrics = run_trial(
+                agent_kwargs, settings, width, height, trial_seconds, warmup_steps
+            )
+            if "error" not in metrics:
+                over_budget = (
+                    memory_budget_mb is not None
+                    and metrics["memory_mb"] is not None
+                    and metrics["memory_mb"] > memory_budget_mb
+                )
+                metrics["within_budget"] = not over_budget
+                log.info(
+                    f"{metrics['steps_per_second']:.1f} steps/s, "
+                    f"{metrics['updates_per_second']:.2f} updates/s "
+                    f"({metrics['trained_per_second']:.1f} transitions trained/s)"
+                    + (
+                        ""
+                        if metrics["memory_mb"] is None
+                        else f", {metrics['memory_mb']:.0f}MB"
+                    )
+                    + (" (over the memory budget)" if over_budget else "")
+                )
+            else:
+                log.warning(f"Trial failed: {metrics['error']}")
+            trials[key] = {"settings": dict(settings), "metrics": metrics}
+        return trials[key]["metrics"]
+
+    best_metrics = measure(best)
+    assert "error" not in best_metrics, "The starting configuration failed."
+    min_steps_per_second = min_steps_fraction * best_metrics["steps_per_second"]
+
+    def score(metrics):
+        if (
+            "error" in metrics
+            or not metrics["within_budget"]
+            or metrics["steps_per_second"] < min_steps_per_second
+        ):
+            return -1.0
+        return metrics["trained_per_second"]
+
+    for knob in KNOBS:
+        for value in space[knob]:
+            candidate = {**best, knob: value}
+            metrics = measure(candidate)
+            if score(metrics) > score(best_metrics):
+                best, best_metrics = candidate, metrics
+    assert score(best_metrics) >= 0, "No configuration ran within the memory budget."
+    log.info(
+        f"Best configuration: {best} "
+        f"({best_metrics['steps_per_second']:.1f} steps/s, "
+        f"{best_metrics['trained_per_second']:.1f} transitions trained/s)"
+    )
+    with open(path, "w") as f:
+        json.dump(
+            {
+                "settings": best,
+                "metrics": best_metrics,
+                "cpu_count": os.cpu_count(),
+                "memory_budget_mb": memory_budget_mb,
+                "min_steps_per_second": min_steps_per_second,
+                "trial_seconds": trial_seconds,
+                "trials": list(trials.values()),
+            },
+            f,
+            indent=2,
+        )
+    log.info(f"Wrote {path}")
+    return best
+
+
+def load_config(path=DEFAULT_CONFIG_PATH):
+    """
+    :return: the settings written by autotune
+    """
+    with open(path) as f:
+        settings = json.load(f)["settings"]
+    assert set(KNOBS) <= set(settings), f"{path} is not an autotune config."
+    return settings
@@ -0,0 +1,65 @@
+from collections import deque
+from time import time
+import pygame
+
+# arrow keys to Snake.get_direction values
+KEY_DIRECTIONS = {
+    pygame.K_LEFT: 0,
+    pygame.K_UP: 1,
+    pygame.K_RIGHT: 2,
+    pygame.K_DOWN: 3,
+}
+
+
+class InputQueue:
+
+    def __init__(self, max_size=3):
+        """
+        - Event driven keyboard input: every KEYDOWN is queued with the time it was polled
+          and the simulation takes one queued turn per step, so presses that start and
+          end between two steps are not lost and quick turns are not merged
+        - Repeated presses of the same direction are only queued once, and presses beyond
+          max_size are dropped so mashing keys cannot build up a backlog
+        :param max_size: most turns waiting at once
+        """
+        self.max_size = max_size
+        self._queue = deque()
+        # seconds a turn waited in the queue, from the poll that read its KEYDOWN to the
+        # step that used it (pygame events carry no press time)
+        self.last_wait: float | None = None
+        self._wait_total = 0.0
+        self._wait_count = 0
+
+    def __len__(self):
+        return len(self._queue)
+
+    def handle_event(self, event):
+        if event.type == pygame.KEYDOWN and event.key in KEY_DIRECTIONS:
+            self.push(KEY_DIRECTIONS[event.key])
+
+    def push(self, direction, timestamp=None):
+        if self._queue and self._queue[-1][0] == direction:
+            return
+        if len(self._queue) >= self.max_size:
+            return
+        self._queue.append((direction, time() if timestamp is None else timestamp))
+
+    def pop(self):
+        """
+        :return: the oldest queued direction, or None
+        """
+        if not self._queue:
+            return None
+        direction, timestamp = self._queue.popleft()
+        self.last_wait = time() - timestamp
+        self._wait_total += self.last_wait
+        self._wait_count += 1
+        return direction
+
+    def mean_wait(self):
+        if not self._wait_count:
+            return None
+        return self._wait_total / self._wait_count
+
+    def clear(self):
+        self._queue.clear()
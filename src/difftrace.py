@@ -0,0 +1,340 @@
+from abc import ABC, abstractmethod
+from agent import Agent
+from gamestate import DIRECTIONS, GameState
+from planner import PathPlanner
+from simulator import SimulatorModel
+import numpy as np
+import multiprocessing
+import time
+import os
+import logging
+
+log = logging.getLogger(__name__)
+
+# what every engine reports after each step, compared in this order
+FIELDS = ("done", "food", "score", "high_score", "board")
+# board shapes covering 1 wide, tiny, non-square and the default boards
+SIZES = ((10, 10), (7, 12), (12, 5), (3, 3), (2, 2), (1, 4))
+# actions before the divergence kept in its report
+_REPORT_ACTIONS = 20
+
+
+class _ScriptedAgent(Agent):
+    """
+    - Plays the actions given to the ReferenceEngine and records the flags it was shown
+    """
+
+    def __init__(self):
+        super().__init__((1, 1), 4, training=False)
+        self.action = 4
+        self.flags = (False, False)
+
+    def update(
+        self, inputs, reward_collision=False, wall_collision=False, keys_pressed=None
+    ):
+        self.flags = (bool(reward_collision), bool(wall_collision))
+        return self.action
+
+    def save_model(self, path):
+        pass
+
+    def load_model(self, path):
+        pass
+
+
+class Engine(ABC):
+
+    def __init__(self, width, height, seed):
+        """
+        - A Snake engine under trace: every engine starts from the same seed, draws its
+          food positions from its own stream with the np.random.RandomState semantics of
+          SimulatorModel, and resets itself when the snake dies
+        """
+        self.width = width
+        self.height = height
+        self.seed = seed
+
+    @abstractmethod
+    def step(self, action):
+        """
+        - One SimulatorModel.update_state step where the agent answered action
+        :return: (done, food, score, high_score, board) as in FIELDS, where done and food
+                 are the flags the agent was shown and board is (width, height, 1)
+        """
+        pass
+
+
+class ReferenceEngine(Engine):
+
+    def __init__(self, width, height, seed):
+        """
+        - SimulatorModel + Snake driven by a scripted agent
+        - SimulatorModel draws from the global np.random state, so this engine keeps its
+          own copy of that state and swaps it in around every step
+        """
+        super().__init__(width, height, seed)
+        self.agent = _ScriptedAgent()
+        self._rng_state = np.random.RandomState(seed).get_state()
+        self.model = self._call(
+            SimulatorModel,
+            width,
+            height,
+            agent=self.agent,
+            max_iterations=None,
+            debug=False,
+        )
+        self.agent.set_simulator(simulator=self.model)
+
+    def _call(self, function, *args, **kwargs):
+        outer = np.random.get_state()
+        np.random.set_state(self._rng_state)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            self._rng_state = np.random.get_state()
+            np.random.set_state(outer)
+
+    def step(self, action):
+        self.agent.action = action
+        self._call(self.model.update_state, keys_pressed=None)
+        food, done = self.agent.flags
+        model = self.model
+        return done, food, model.snake.length, model.high_score, model.board
+
+    def state(self):
+        """
+        - GameState at the start of the next step, for the policies choosing actions
+        """
+        return GameState.from_model(self.model)
+
+
+class GameStateEngine(Engine):
+
+    def __init__(self, width, height, seed):
+        """
+        - GameState with auto_reset, the undo history is dropped after every step
+        """
+        super().__init__(width, height, seed)
+        self.game = GameState(
+            width, height, rng=np.random.RandomState(seed), auto_reset=True
+        )
+
+    def step(self, action):
+        food, wall_hit, snake_hit = self.game.apply(action)
+        self.game.commit()
+        game = self.game
+        return wall_hit or snake_hit, food, game.length, game.high_score, game.board()
+
+
+ENGINES = {
+    "gamestate": GameStateEngine,
+}
+
+
+def fuzz_policy(width, height, rng):
+    """
+    - Uniformly random actions, including 4 (keep going)
+    """
+    return lambda reference: int(rng.randint(0, 5))
+
+
+def wall_policy(width, height, rng):
+    """
+    - Head for the nearest wall, then hug the edges, now and then turning into the wall
+      or back into the board
+    """
+
+    def policy(reference):
+        x, y = reference.state().head
+        if not (0 <= x < width and 0 <= y < height):
+            return int(rng.randint(0, 5))
+        on_edge = x in (0, width - 1) or y in (0, height - 1)
+        if not on_edge or rng.rand() < 0.1:
+            distances = (x, y, width - 1 - x, height - 1 - y)
+            if rng.rand() < 0.5:
+                return int(np.argmin(distances))
+            return int(rng.randint(0, 5))
+        # moves that stay on an edge or leave the board
+        moves = [
+            action
+            for action, (dx, dy) in enumerate(DIRECTIONS)
+            if not (0 < x + dx < width - 1 and 0 < y + dy < height - 1)
+        ]
+        return int(moves[rng.randint(len(moves))])
+
+    return policy
+
+
+def long_snake_policy(width, height, rng):
+    """
+    - PathPlanner games grow long snakes, a few random moves make them die with most of
+      the board covered
+    """
+    planner = PathPlanner(width, height)
+
+    def policy(reference):
+        if rng.rand() < 0.005:
+            return int(rng.randint(0, 5))
+        return planner.plan(reference.state())
+
+    return policy
+
+
+# policies are built with (width, height, rng) and called with the ReferenceEngine
+SCENARIOS = {
+    "fuzz": fuzz_policy,
+    "walls": wall_policy,
+    "long": long_snake_policy,
+}
+
+
+class Divergence:
+
+    def __init__(self, trace, step, field, expected, actual, actions):
+        """
+        - First step at which an engine disagreed with the ReferenceEngine
+        :param trace: (engine, scenario, width, height, seed) of the trace
+        :param step: 0-based step index
+        :param field: first field of FIELDS that differs
+        :param actions: every action of the trace up to and including this step, so it
+                        can be replayed with replay_trace
+        """
+        self.trace = trace
+        self.step = step
+        self.field = field
+        self.expected = expected
+        self.actual = actual
+        self.actions = actions
+
+    def __str__(self):
+        engine, scenario, width, height, seed = self.trace
+        lines = [
+            f"{engine} diverged from the reference in the {scenario} trace "
+            f"(board {width}x{height}, seed {seed}) at step {self.step}: {self.field}",
+            f"last actions: {self.actions[-_REPORT_ACTIONS:]}",
+        ]
+        if self.field == "board":
+            lines.append("expected (rows are y):")
+            lines.append(str(self.expected[..., 0].T))
+            lines.append("actual:")
+            lines.append(str(self.actual[..., 0].T))
+        else:
+            lines.append(f"expected {self.expected}, actual {self.actual}")
+        return "\n".join(lines)
+
+
+def _compare(expected, actual):
+    """
+    :return: (field, expected value, actual value) of the first differing field, or None
+    """
+    for field, a, b in zip(FIELDS, expected, actual):
+        equal = np.array_equal(a, b) if field == "board" else a == b
+        if not equal:
+            return field, np.copy(a) if field == "board" else a, b
+    return None
+
+
+def run_trace(engine, scenario, width, height, seed, steps):
+    """
+    - Drive the ReferenceEngine and an engine with the same seed and actions, the actions
+      come from the scenario's policy looking at the reference
+    :return: Divergence or None
+    """
+    reference = ReferenceEngine(width, height, seed)
+    candidate = ENGINES[engine](width, height, seed)
+    policy = SCENARIOS[scenario](width, height, np.random.RandomState(seed))
+    actions = []
+    for step in range(steps):
+        action = policy(reference)
+        actions.append(action)
+        difference = _compare(reference.step(action), candidate.step(action))
+        if difference is not None:
+            trace = (engine, scenario, width, height, seed)
+            return Divergence(trace, step, *difference, actions)
+    return None
+
+
+def replay_trace(engine, width, height, seed, actions):
+    """
+    - Run a recorded action sequence (e.g. Divergence.actions) through both engines
+    :return: Divergence or None
+    """
+    reference = ReferenceEngine(width, height, seed)
+    candidate = ENGINES[engine](width, height, seed)
+    for step, action in enumerate(actions):
+        difference = _compare(reference.step(action), candidate.step(action))
+        if difference is not None:
+            trace = (engine, "replay", width, height, seed)
+            return Divergence(trace, step, *difference, list(actions[: step + 1]))
+    return None
+
+
+def _run_trace(job):
+    index, args = job
+    divergence = run_trace(*args)
+    steps = args[-1] if divergence is None else divergence.step + 1
+    return index, divergence, steps
+
+
+def verify_traces(
+    num_traces,
+    steps=1000,
+    engine="gamestate",
+    scenarios=tuple(SCENARIOS),
+    sizes=SIZES,
+    processes=None,
+    seed=0,
+):
+    """
+    - Run num_traces traces, cycling through scenarios and board sizes with consecutive
+      seeds, spread over worker processes
+    - Traces are independent, so every one runs to its own first divergence
+    :param steps: steps per trace
+    :param engine: key of ENGINES to check against the reference
+    :param processes: worker processes, defaults to the number of CPUs
+    :param seed: seed of the first trace
+    :return: the divergence of the lowest numbered diverging trace, or None
+    """
+    jobs = [
+        (
+            i,
+            (
+                engine,
+                scenarios[i % len(scenarios)],
+                *sizes[(i // len(scenarios)) % len(sizes)],
+                seed + i,
+                steps,
+            ),
+        )
+        for i in range(num_traces)
+    ]
+    processes = processes or os.cpu_count() or 1
+    log.info(
+        f"Tracing {engine} against the reference: {num_traces} traces of {steps} steps "
+        f"on {processes} processes..."
+    )
+    start = time.perf_counter()
+    divergences = {}
+    done = 0
+    total_steps = 0
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(processes) as pool:
+        for index, divergence, trace_steps in pool.imap_unordered(
+            _run_trace, jobs, chunksize=max(1, num_traces // (processes * 16))
+        ):
+            done += 1
+            total_steps += trace_steps
+            if divergence is not None:
+                divergences[index] = divergence
+            if done % max(1, num_traces // 10) == 0:
+                log.info(f"{done}/{num_traces} traces, {len(divergences)} diverged")
+    elapsed = time.perf_counter() - start
+    log.info(
+        f"{total_steps} steps in {elapsed:.1f}s "
+        f"({total_steps / elapsed:.0f} steps/s)."
+    )
+    if not divergences:
+        log.info(f"{engine} matched the reference on every step.")
+        return None
+    log.error(f"{len(divergences)} of {num_traces} traces diverged.")
+    return divergences[min(divergences)]
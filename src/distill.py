@@ -0,0 +1,219 @@
+from agent import Agent
+from simulator import SimulatorModel
+from tensorflow.keras.layers import Dense, InputLayer, Conv2D, Flatten
+from tensorflow.keras.losses import CategoricalCrossentropy
+from tensorflow.keras.optimizers import Adam
+from tensorflow.keras import Sequential
+import numpy as np
+import time
+import os
+import logging
+
+log = logging.getLogger(__name__)
+
+STUDENTS = ("conv", "mlp")
+LOSSES = ("q", "policy")
+# states kept back from training to measure agreement on
+_HOLDOUT = 0.1
+
+
+def build_student(input_shape, num_outputs, kind="conv"):
+    """
+    - conv: two stride 2 convolutions with 8 and 16 channels and a Dense(32), a few
+      hundred times fewer parameters and multiply-adds than the QLearningAgent network
+    - mlp: a single Dense(64) hidden layer
+    :param input_shape: (width, height) of the stacked frames
+    """
+    assert kind in STUDENTS, f"Unknown student {kind}, use one of {STUDENTS}."
+    model = Sequential()
+    model.add(InputLayer(shape=(*input_shape, 1)))
+    if kind == "conv":
+        model.add(Conv2D(8, (3, 3), strides=2, activation="relu", padding="same"))
+        model.add(Conv2D(16, (3, 3), strides=2, activation="relu", padding="same"))
+        model.add(Flatten())
+        model.add(Dense(32, activation="relu"))
+    else:
+        model.add(Flatten())
+        model.add(Dense(64, activation="relu"))
+    model.add(Dense(num_outputs, activation="linear"))
+    return model
+
+
+class _Recorder(Agent):
+
+    def __init__(self, agent, explore=0.0, seed=None, record=True):
+        """
+        - Plays an agent, recording the states it is shown and the time it takes to decide
+        - With probability explore a random action is played instead, so the recorded
+          states also cover situations the agent gets itself into by mistake
+        """
+        super().__init__(agent.input_shape, agent.num_outputs, training=False)
+        self.agent = agent
+        self.explore = explore
+        self.rng = np.random.RandomState(seed)
+        self.record = record
+        self.states = []
+        self.decisions = 0
+        self.decision_time = 0.0
+
+    def set_simulator(self, simulator):
+        super().set_simulator(simulator)
+        self.agent.set_simulator(simulator=simulator)
+
+    def update(
+        self, inputs, reward_collision=False, wall_collision=False, keys_pressed=None
+    ):
+        if self.record:
+            self.states.append(inputs.astype(np.int8))
+        start = time.perf_counter()
+        action = self.agent.update(
+            inputs, reward_collision, wall_collision, keys_pressed
+        )
+        self.decision_time += time.perf_counter() - start
+        self.decisions += 1
+        if self.explore and self.rng.rand() < self.explore:
+            action = self.rng.randint(0, self.num_outputs)
+        return action
+
+    def save_model(self, path):
+        pass
+
+    def load_model(self, path):
+        pass
+
+
+def collect_states(teacher, num_states, width, height, explore=0.1, seed=0):
+    """
+    - Run the teacher headlessly and keep every state it is shown
+    :return: int8 array (num_states, *teacher.input_shape, 1)
+    """
+    recorder = _Recorder(teacher, explore=explore, seed=seed)
+    np.random.seed(seed)
+    model = SimulatorModel(
+        width, height, agent=recorder, max_iterations=None, debug=False
+    )
+    recorder.set_simulator(simulator=model)
+    while len(recorder.states) < num_states:
+        model.update_state(keys_pressed=None)
+    return np.stack(recorder.states[:num_states])
+
+
+def evaluate(agent, episodes, width, height, seed=0):
+    """
+    - Play episodes headless games with the agent
+    :return: (mean score, seconds per decision)
+    """
+    recorder = _Recorder(agent, record=False)
+    np.random.seed(seed)
+    model = SimulatorModel(
+        width, height, agent=recorder, max_iterations=None, debug=False
+    )
+    recorder.set_simulator(simulator=model)
+    while len(model.scores) < episodes:
+        model.update_state(keys_pressed=None)
+    return (
+        float(np.mean(model.scores[:episodes])),
+        recorder.decision_time / max(recorder.decisions, 1),
+    )
+
+
+def _softmax(q_values, temperature):
+    logits = q_values / temperature
+    logits -= logits.max(axis=1, keepdims=True)
+    probabilities = np.exp(logits)
+    return probabilities / probabilities.sum(axis=1, keepdims=True)
+
+
+def train_student(
+    student, states, q_values, loss="q", temperature=0.01, epochs=30, batch_size=256
+):
+    """
+    - q: regress the teacher's Q values (mse), the student stays a Q network that
+      QLearningAgent can keep training
+    - policy: match the teacher's softmax(Q / temperature) action distribution (KL up
+      to a constant), the student's outputs are then logits, argmax is unchanged
+    """
+    assert loss in LOSSES, f"Unknown loss {loss}, use one of {LOSSES}."
+    if loss == "q":
+        student.compile(optimizer=Adam(learning_rate=1e-3), loss="mse")
+        targets = q_values
+    else:
+        student.compile(
+            optimizer=Adam(learning_rate=1e-3),
+            loss=CategoricalCrossentropy(from_logits=True),
+        )
+        targets = _softmax(q_values, temperature)
+    student.fit(states, targets, epochs=epochs, batch_size=batch_size, verbose=0)
+
+
+def distill(
+    agent_factory,
+    num_states,
+    width,
+    height,
+    kind="conv",
+    loss="q",
+    path="student.keras",
+    episodes=20,
+    explore=0.1,
+    epochs=30,
+    seed=0,
+):
+    """
+    - Distill a trained QLearningAgent (the teacher) into a small student network:
+      collect states by playing the teacher, label them with its Q values, train the
+      student, and save it whole so that --model path loads it into a QLearningAgent
+    - Reports the student's agreement with the teacher's greedy action on held out
+      states, and the evaluation score, per decision latency and parameter count of both
+    :param agent_factory: builds the teacher QLearningAgent, also used to load the student
+    :param num_states: states to collect
+    :param width: board cells across
+    :param height: board cells upwards
+    :param kind: student architecture, see build_student
+    :param loss: see train_student
+    :param path: file in src/assets/models to save the student to
+    :param episodes: evaluation games per network
+    :param explore: share of random actions while collecting
+    :return: report dict
+    """
+    assert path.endswith(".keras"), "The student is saved whole, use a .keras path."
+    # neither network is trained here, and neither writes model_n.weights.h5 files
+    teacher = agent_factory(training_model=False, save_after=None)
+    start = time.perf_counter()
+    states = collect_states(teacher, num_states, width, height, explore, seed)
+    q_values = teacher._model.predict(
+        states.astype(np.float32), batch_size=1024, verbose=0
+    )
+    log.info(
+        f"Collected and labelled {len(states)} states in "
+        f"{time.perf_counter() - start:.1f}s."
+    )
+    split = len(states) - max(int(len(states) * _HOLDOUT), 1)
+    student = build_student(teacher.input_shape, teacher.num_outputs, kind)
+    start = time.perf_counter()
+    train_student(student, states[:split], q_values[:split], loss=loss, epochs=epochs)
+    log.info(f"Trained the {kind} student in {time.perf_counter() - start:.1f}s.")
+    held_out = student.predict(states[split:].astype(np.float32), verbose=0)
+    agreement = float(
+        np.mean(np.argmax(held_out, axis=1) == np.argmax(q_values[split:], axis=1))
+    )
+    student.save(os.path.join("src", "assets", "models", path))
+    # evaluate the student the way it will be deployed
+    deployed = agent_factory(training_model=False, save_after=None, model_path=path)
+    report = {"agreement": agreement}
+    for name, agent in (("teacher", teacher), ("student", deployed)):
+        score, latency = evaluate(agent, episodes, width, height, seed)
+        report[name] = {
+            "parameters": agent._model.count_params(),
+            "score": score,
+            "latency_ms": 1000 * latency,
+        }
+        log.info(
+            f"{name}: {report[name]['parameters']} parameters, mean score {score:.2f} "
+            f"over {episodes} games, {1000 * latency:.2f}ms per decision."
+        )
+    log.info(
+        f"Student agrees with the teacher on {100 * agreement:.1f}% of held out "
+        f"states, saved to {path} (use --model {path})."
+    )
+    return report
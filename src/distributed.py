@@ -0,0 +1,368 @@
+from experience import Experience, arrays_to_experiences, experiences_to_arrays
+from qlearn import ReplayMemory
+import numpy as np
+import io
+import json
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+import logging
+
+log = logging.getLogger(__name__)
+
+# message types
+HELLO = 1
+BATCH = 2
+ACK = 3
+# what happened to a batch, sent back in its ACK
+ACCEPTED = "accepted"
+STALE = "stale"
+SHUTDOWN = "shutdown"
+
+_FRAME = struct.Struct("!BI")  # type, payload length
+_HEADER = struct.Struct("!I")  # json header length
+
+
+def encode_message(msg_type, header, arrays=None):
+    """
+    - Frame layout: type (1 byte), payload length (4 bytes), payload
+    - Payload layout: json header length (4 bytes), json header, compressed npz of arrays
+    """
+    header_bytes = json.dumps(header).encode()
+    body = b""
+    if arrays:
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, **arrays)
+        body = buffer.getvalue()
+    payload = _HEADER.pack(len(header_bytes)) + header_bytes + body
+    return _FRAME.pack(msg_type, len(payload)) + payload
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size > 0:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("Connection closed by peer")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def recv_message(sock):
+    """
+    :return: (msg_type, header dict, arrays dict)
+    """
+    msg_type, length = _FRAME.unpack(_recv_exactly(sock, _FRAME.size))
+    payload = _recv_exactly(sock, length)
+    (header_length,) = _HEADER.unpack_from(payload)
+    header_end = _HEADER.size + header_length
+    header = json.loads(payload[_HEADER.size : header_end])
+    arrays = {}
+    if len(payload) > header_end:
+        with np.load(io.BytesIO(payload[header_end:]), allow_pickle=False) as data:
+            arrays = {key: data[key] for key in data.files}
+    return msg_type, header, arrays
+
+
+def weights_to_arrays(weights):
+    return {f"w{i}": w for i, w in enumerate(weights)}
+
+
+def arrays_to_weights(arrays):
+    return [arrays[f"w{i}"] for i in range(len(arrays))]
+
+
+class _ActorHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        server = self.server.parameter_server
+        name = self.client_address
+        try:
+            while True:
+                msg_type, header, arrays = recv_message(self.request)
+                if msg_type == HELLO:
+                    name = header.get("actor", name)
+                    log.info(f"Actor {name} connected.")
+                    self.request.sendall(server.reply(-1, ACCEPTED))
+                elif msg_type == BATCH:
+                    status = server.receive_batch(header["version"], arrays)
+                    self.request.sendall(server.reply(header["current"], status))
+        except (ConnectionError, OSError):
+            log.info(f"Actor {name} disconnected.")
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class ParameterServer:
+
+    def __init__(
+        self,
+        agent,
+        host="127.0.0.1",
+        port=5555,
+        publish_every=10,
+        max_staleness=5,
+        max_pending_batches=8,
+        replay_ratio=0.1,
+    ):
+        """
+        - Learner side: ingests transition batches from actors into the agent's replay
+          memory, trains, and publishes versioned weights
+        - Actors wait for an ACK before sending their next batch, and batches are only
+          ACKed once they fit in the pending queue, so a slow learner throttles actors
+        - Every ACKed batch is trained on, serve() drains the pending queue after stopping
+        - Batches collected with a policy more than max_staleness versions old are dropped
+        :param agent: QLearningAgent that does the training
+        :param publish_every: training updates between weight versions
+        :param max_staleness: oldest accepted policy version, relative to the latest
+        :param max_pending_batches: batches waiting for the learner before actors block
+        :param replay_ratio: training updates per received transition
+        """
+        self.agent = agent
+        self.publish_every = publish_every
+        self.max_staleness = max_staleness
+        self.replay_ratio = replay_ratio
+        self.version = 0
+        self.updates = 0
+        self.transitions = 0
+        self.dropped = 0
+        self._pending = queue.Queue(maxsize=max_pending_batches)
+        # makes queueing a batch and stopping mutually exclusive
+        self._pending_lock = threading.Lock()
+        self._weights_lock = threading.Lock()
+        self._weights_messages = {}
+        self._update_budget = 0.0
+        self._stopped = threading.Event()
+        self._publish()
+        self._server = _Server((host, port), _ActorHandler)
+        self._server.parameter_server = self
+        self.address = self._server.server_address
+
+    def receive_batch(self, version, arrays):
+        """
+        - Called from actor handler threads, blocks while the pending queue is full
+        :return: ACCEPTED, STALE or SHUTDOWN when the server stopped before the batch
+                 could be queued
+        """
+        if self.version - version > self.max_staleness:
+            self.dropped += 1
+            return STALE
+        while True:
+            with self._pending_lock:
+                if self._stopped.is_set():
+                    return SHUTDOWN
+                try:
+                    self._pending.put(arrays, timeout=0.5)
+                    return ACCEPTED
+                except queue.Full:
+                    continue
+
+    def reply(self, actor_version, status):
+        """
+        - ACK carrying the latest weights when the actor is behind
+        """
+        with self._weights_lock:
+            if actor_version < self.version:
+                return self._weights_messages[status]
+            return encode_message(ACK, {"version": self.version, "status": status})
+
+    def serve(self, max_updates=None):
+        """
+        - Accept actors on a background thread and train on the calling thread
+        :param max_updates: stop after this many training updates (None = until stop())
+        """
+        thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        thread.start()
+        log.info(f"Parameter server listening on {self.address[0]}:{self.address[1]}")
+        try:
+            while not self._stopped.is_set():
+                if max_updates is not None and self.updates >= max_updates:
+                    break
+                try:
+                    arrays = self._pending.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                self._ingest(arrays)
+        finally:
+            self.stop()
+            # the actors were told these batches were accepted
+            while not self._pending.empty():
+                self._ingest(self._pending.get())
+            log.info(
+                f"Parameter server stopped: version {self.version}, {self.updates} updates, "
+                f"{self.transitions} transitions, {self.dropped} stale batches dropped."
+            )
+
+    def stop(self):
+        """
+        - Stop accepting batches, serve() returns once it has ingested the pending ones
+        """
+        with self._pending_lock:
+            if self._stopped.is_set():
+                return
+            self._stopped.set()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _ingest(self, arrays):
+        experiences = arrays_to_experiences(arrays)
+        for experience in experiences:
+            self.agent.replay_memory.add_experience(experience)
+        self.transitions += len(experiences)
+        self._update_budget += len(experiences) * self.replay_ratio
+        while self._update_budget >= 1:
+            self.agent._train_model()
+            self._update_budget -= 1
+            self.updates += 1
+            if self.updates % self.publish_every == 0:
+                self._publish()
+
+    def _publish(self):
+        arrays = weights_to_arrays(self.agent._model.get_weights())
+        version = self.version + 1
+        # serialize once per version, only the status differs between replies
+        messages = {
+            status: encode_message(ACK, {"version": version, "status": status}, arrays)
+            for status in (ACCEPTED, STALE, SHUTDOWN)
+        }
+        with self._weights_lock:
+            self.version = version
+            self._weights_messages = messages
+        log.debug(f"Published weights version {version}")
+
+
+class ActorClient:
+
+    def __init__(
+        self,
+        host,
+        port,
+        on_weights,
+        name="actor",
+        reconnect_delay=0.5,
+        max_reconnect_delay=30.0,
+    ):
+        """
+        - Actor side connection to a ParameterServer
+        - Any socket error closes the connection and retries with exponential backoff
+        :param on_weights: called with the weight list whenever the learner sends newer weights
+        """
+        self.host = host
+        self.port = port
+        self.on_weights = on_weights
+        self.name = name
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.version = -1
+        self._sock = None
+
+    def connect(self):
+        """
+        - Connect (retrying until the learner is up) and fetch the latest weights
+        """
+        delay = self.reconnect_delay
+        while True:
+            try:
+                self._sock = socket.create_connection((self.host, self.port))
+                self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                self._sock.sendall(encode_message(HELLO, {"actor": self.name}))
+                self._read_ack()
+                return
+            except (ConnectionError, OSError):
+                self.close()
+                log.info(f"Learner not reachable, retrying in {delay:.1f}s")
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+
+    def send_batch(self, arrays, version):
+        """
+        - Send a batch and wait for the ACK, reconnecting until it goes through
+        :param version: weights version the batch was collected with
+        :return: ACCEPTED, STALE or SHUTDOWN
+        """
+        while True:
+            try:
+                if self._sock is None:
+                    self.connect()
+                header = {"version": version, "current": self.version}
+                self._sock.sendall(encode_message(BATCH, header, arrays))
+                return self._read_ack()
+            except (ConnectionError, OSError) as e:
+                log.warning(f"Lost connection to learner ({e}), reconnecting...")
+                self.close()
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def _read_ack(self):
+        msg_type, header, arrays = recv_message(self._sock)
+        assert msg_type == ACK, "Unexpected message type {}".format(msg_type)
+        if arrays:
+            self.version = header["version"]
+            self.on_weights(arrays_to_weights(arrays))
+        return header["status"]
+
+
+class TransitionOutbox(ReplayMemory):
+    """
+    - Replaces an actor agent's replay memory: experiences are batched and shipped to the
+      learner instead of being trained on locally
+    - Weights sent back by the learner are loaded into the agent right away
+    """
+
+    def __init__(self, agent, host, port, name="actor", flush_size: int = 64):
+        super().__init__(max_size=flush_size)
+        self.agent = agent
+        self.flush_size = flush_size
+        self.accepted = 0
+        self.rejected = 0
+        self.undelivered = 0
+        self.client = ActorClient(host, port, on_weights=self._load, name=name)
+        self._batch_version = None
+
+    def add_experience(self, ex: Experience):
+        if not self._arr:
+            self._batch_version = self.client.version
+        self._arr.append(ex)
+        self._size += 1
+        if self._size >= self.flush_size:
+            self.flush()
+
+    def flush(self):
+        if not self._arr:
+            return
+        arrays = experiences_to_arrays(self._arr)
+        status = self.client.send_batch(arrays, self._batch_version)
+        if status == ACCEPTED:
+            self.accepted += self._size
+        elif status == STALE:
+            self.rejected += self._size
+            log.debug("Learner rejected a stale batch")
+        else:
+            self.undelivered += self._size
+            log.debug("Learner is shutting down, batch not delivered")
+        self._arr = []
+        self._size = 0
+
+    def close(self):
+        self.flush()
+        self.client.close()
+        log.info(
+            f"Actor {self.client.name}: {self.accepted} transitions accepted, "
+            f"{self.rejected} rejected as stale, {self.undelivered} not delivered "
+            f"(learner shutting down)."
+        )
+
+    def _load(self, weights):
+        self.agent._model.set_weights(weights)
+        self.agent.weights_updated()
+        log.debug(f"Loaded learner weights version {self.client.version}")
@@ -0,0 +1,59 @@
+import numpy as np
+
+
+class Experience:
+
+    def __init__(
+        self,
+        current_state,
+        current_action,
+        resulting_reward,
+        resulting_state,
+        n_steps: int = 1,
+    ):
+        """
+        Holds the memory for replay
+        :param current_state: the current state of the model
+        :param current_action: the action that was chosen
+        :param res_reward: the resulting reward (discounted sum for n-step experiences)
+        :param res_state: the resulting state
+        :param n_steps: number of decisions between current_state and next_state
+        """
+        self.current_state: np.ndarray = current_state
+        self.current_action: int = current_action
+        self.res_reward: int = resulting_reward
+        self.next_state: np.ndarray = resulting_state
+        self.n_steps: int = n_steps
+
+
+def experiences_to_arrays(experiences):
+    """
+    - Stack experiences into arrays (network transfer, snapshots)
+    - Boards only hold -1, 0 and 1, so states are stored as int8
+    """
+    return {
+        "states": np.concatenate([e.current_state for e in experiences]).astype(
+            np.int8
+        ),
+        "actions": np.array([e.current_action for e in experiences], dtype=np.int8),
+        "rewards": np.array([e.res_reward for e in experiences], dtype=np.float64),
+        "next_states": np.concatenate([e.next_state for e in experiences]).astype(
+            np.int8
+        ),
+        "n_steps": np.array([e.n_steps for e in experiences], dtype=np.int16),
+    }
+
+
+def arrays_to_experiences(arrays):
+    states = arrays["states"].astype(np.float64)
+    next_states = arrays["next_states"].astype(np.float64)
+    return [
+        Experience(
+            current_state=states[i : i + 1],
+            current_action=int(arrays["actions"][i]),
+            resulting_reward=float(arrays["rewards"][i]),
+            resulting_state=next_states[i : i + 1],
+            n_steps=int(arrays["n_steps"][i]),
+        )
+        for i in range(len(states))
+    ]
@@ -0,0 +1,320 @@
+from constants import FOOD_COLOR, SNAKE_COLOR
+from collections import deque
+import numpy as np
+
+EMPTY = 0
+SNAKE = 1
+FOOD = 2
+
+# left, up, right, down (same order as Snake.get_direction)
+DIRECTIONS = ((-1, 0), (0, -1), (1, 0), (0, 1))
+START_POSITION = (0, 0)
+START_DIRECTION = 2
+
+# undo record kinds
+_MOVE = 0
+_OUT_OF_BOUNDS = 1
+_DEATH = 2
+_RESET = 3
+
+
+class GameState:
+
+    def __init__(self, width, height, rng=None, auto_reset=False):
+        """
+        - Compact Snake state with the exact step semantics of SimulatorModel.update_state
+        - The board is a flat bytearray, the body a deque of (x, y) tuples from head to
+          tail, and per-cell body counts make collision checks O(1)
+        - apply() pushes an undo record, so search can walk a game tree with apply/undo
+          instead of copying the state at every node
+        :param width: cells across
+        :param height: cells upwards
+        :param rng: np.random.RandomState for food placement, defaults to the global
+                    np.random state (what SimulatorModel uses)
+        :param auto_reset: start a new episode on death like SimulatorModel, otherwise the
+                           state is marked done and apply() may not be called again
+        """
+        self.width = width
+        self.height = height
+        self.rng = np.random if rng is None else rng
+        self.auto_reset = auto_reset
+        self.grid = bytearray(width * height)
+        self.counts = bytearray(width * height)
+        self.body = deque()
+        self.direction = START_DIRECTION
+        self.length = 1
+        self.food = START_POSITION
+        self.done = False
+        self.episode = 1
+        self.high_score = 0
+        self.scores = []
+        self._undo = []
+        self._place_snake()
+        self.food = self._generate_food()
+        self.grid[self._cell(self.food)] = FOOD
+
+    @classmethod
+    def from_model(cls, model, rng=None, auto_reset=False):
+        """
+        - Build the state at the start of the current SimulatorModel step
+        - Safe to call from Agent.update, where the food cell has already been cleared
+        """
+        state = cls.__new__(cls)
+        state.width = model.width
+        state.height = model.height
+        state.rng = np.random if rng is None else rng
+        state.auto_reset = auto_reset
+        cells = model.board[..., 0]
+        grid = np.where(cells == SNAKE_COLOR, SNAKE, EMPTY).astype(np.uint8)
+        grid[cells == FOOD_COLOR] = FOOD
+        grid[model.food[0], model.food[1]] = FOOD
+        state.grid = bytearray(grid.tobytes())
+        state.counts = bytearray(model.width * model.height)
+        state.body = deque()
+        for cell in model.snake.cells():
+            position = (int(cell.current_position[0]), int(cell.current_position[1]))
+            state.body.append(position)
+            if state._in_bounds(position):
+                state.counts[state._cell(position)] += 1
+        state.direction = int(model.snake.current_direction)
+        state.length = model.snake.length
+        state.food = (int(model.food[0]), int(model.food[1]))
+        state.done = False
+        state.episode = model.iteration_num
+        state.high_score = model.high_score
+        state.scores = list(model.scores)
+        state._undo = []
+        return state
+
+    def clone(self, rng=None):
+        """
+        - Independent copy of the current state (flat buffer copies, no SnakeCell chain)
+        - The undo history is not copied, and the rng is shared unless one is given
+        """
+        state = GameState.__new__(GameState)
+        state.width = self.width
+        state.height = self.height
+        state.rng = self.rng if rng is None else rng
+        state.auto_reset = self.auto_reset
+        state.grid = self.grid[:]
+        state.counts = self.counts[:]
+        state.body = self.body.copy()
+        state.direction = self.direction
+        state.length = self.length
+        state.food = self.food
+        state.done = self.done
+        state.episode = self.episode
+        state.high_score = self.high_score
+        state.scores = list(self.scores)
+        state._undo = []
+        return state
+
+    @property
+    def head(self):
+        return self.body[0]
+
+    def status(self):
+        """
+        - Flags SimulatorModel.update_state would report for the current head
+        :return: (food, wall_hit, snake_hit)
+        """
+        head = self.body[0]
+        if not self._in_bounds(head):
+            return False, True, False
+        return head == self.food, False, self.counts[self._cell(head)] > 1
+
+    def apply(self, action):
+        """
+        - One SimulatorModel.update_state step where the agent answered action
+        - Like the reference engine, collisions are detected at the start of the step
+          after the move that caused them
+        :param action: 0 - 3 like Snake.get_direction, 4 = keep going
+        :return: (food, wall_hit, snake_hit) as passed to the agent this step
+        """
+        assert not self.done, "Cannot apply an action to a finished game"
+        food, wall_hit, snake_hit = self.status()
+        writes = []
+        food_cell = self._cell(self.food)
+        self._write(writes, food_cell, EMPTY)
+        direction = self.direction
+        if action != 4:
+            self.direction = action
+        if wall_hit or snake_hit:
+            self._die(writes, direction, food)
+        else:
+            self._move(writes, direction, food)
+        return food, wall_hit, snake_hit
+
+    def undo(self):
+        """
+        - Revert the most recent apply()
+        """
+        record = self._undo.pop()
+        kind, writes, direction, food, rng_state = record[:5]
+        if kind == _RESET:
+            # bring back the pre-death grid first, the recorded writes were made to it
+            _, _, _, _, _, grid, counts, body, length, high_score = record
+            self.grid = grid
+            self.counts = counts
+            self.body = body
+            self.length = length
+            self.episode -= 1
+            self.scores.pop()
+            self.high_score = high_score
+        for cell, value in reversed(writes):
+            self.grid[cell] = value
+        self.direction = direction
+        self.food = food
+        if rng_state is not None:
+            self.rng.set_state(rng_state)
+        if kind == _MOVE:
+            _, _, _, _, _, new_head, tail = record
+            self.body.popleft()
+            self.counts[self._cell(new_head)] -= 1
+            if tail is None:
+                self.length -= 1
+            else:
+                self.body.append(tail)
+                self.counts[self._cell(tail)] += 1
+        elif kind == _OUT_OF_BOUNDS:
+            _, _, _, _, _, old_head, grew = record
+            if grew:
+                tail = self.body.pop()
+                if self._in_bounds(tail):
+                    self.counts[self._cell(tail)] -= 1
+                self.length -= 1
+            self.body[0] = old_head
+            self.counts[self._cell(old_head)] += 1
+        elif kind == _DEATH:
+            self.length = record[5]
+            self.done = False
+            self.scores.pop()
+            self.high_score = record[6]
+
+    def commit(self):
+        """
+        - Forget the undo history, e.g. when the state is used as a plain simulator
+        """
+        self._undo.clear()
+
+    def board(self):
+        """
+        - Board in the SimulatorModel format (width, height, 1)
+        """
+        grid = np.frombuffer(bytes(self.grid), dtype=np.uint8).reshape(
+            self.width, self.height, 1
+        )
+        board = np.zeros(grid.shape)
+        board[grid == SNAKE] = SNAKE_COLOR
+        board[grid == FOOD] = FOOD_COLOR
+        return board
+
+    def _move(self, writes, direction, food):
+        head = self.body[0]
+        dx, dy = DIRECTIONS[self.direction]
+        new_head = (head[0] + dx, head[1] + dy)
+        old_food = self.food
+        rng_state = None
+        if not self._in_bounds(new_head):
+            # SnakeCell.shift stops at the head, the body stays where it was
+            self.counts[self._cell(head)] -= 1
+            self.body[0] = new_head
+            if food:
+                # the grown tail is never drawn, the game ends on the next step anyway
+                tail = head if len(self.body) == 1 else self.body[-1]
+                self.body.append(tail)
+                if self._in_bounds(tail):
+                    self.counts[self._cell(tail)] += 1
+                self.length += 1
+                rng_state = self._refresh_food(writes)
+            else:
+                self._write(writes, self._cell(self.food), FOOD)
+            self._undo.append(
+                (_OUT_OF_BOUNDS, writes, direction, old_food, rng_state, head, food)
+            )
+            return
+        tail = self.body[-1]
+        new_cell = self._cell(new_head)
+        # net effect of every cell clearing its old position and drawing its new one:
+        # the old head is redrawn (it is blank when it moved onto the tail last step),
+        # the new head is set, then the old tail is cleared (even when the head is on it)
+        if len(self.body) > 1:
+            self._write(writes, self._cell(head), SNAKE)
+        self._write(writes, new_cell, SNAKE)
+        self._write(writes, self._cell(tail), EMPTY)
+        self.body.appendleft(new_head)
+        self.counts[new_cell] += 1
+        if food:
+            # the new tail cell is not drawn until it moves
+            self.length += 1
+            rng_state = self._refresh_food(writes)
+            self._undo.append(
+                (_MOVE, writes, direction, old_food, rng_state, new_head, None)
+            )
+        else:
+            self.body.pop()
+            self.counts[self._cell(tail)] -= 1
+            self._write(writes, self._cell(self.food), FOOD)
+            self._undo.append(
+                (_MOVE, writes, direction, old_food, None, new_head, tail)
+            )
+
+    def _die(self, writes, direction, food):
+        length = self.length
+        high_score = self.high_score
+        old_food = self.food
+        # the snake still eats on the step it dies if its head sits on the food
+        score = self.length + food
+        self.scores.append(score)
+        self.high_score = max(self.high_score, score)
+        if not self.auto_reset:
+            self.length = score
+            self.done = True
+            self._write(writes, self._cell(self.food), FOOD)
+            self._undo.append(
+                (_DEATH, writes, direction, old_food, None, length, high_score)
+            )
+            return
+        record_state = (self.grid, self.counts, self.body, length, high_score)
+        self.grid = bytearray(self.width * self.height)
+        self.counts = bytearray(self.width * self.height)
+        self.body = deque()
+        self._place_snake()
+        self.direction = START_DIRECTION
+        self.length = 1
+        self.episode += 1
+        rng_state = self._refresh_food([])
+        # writes were made to the discarded grid, restoring that grid undoes them
+        self._undo.append(
+            (_RESET, writes, direction, old_food, rng_state, *record_state)
+        )
+
+    def _refresh_food(self, writes):
+        rng_state = self.rng.get_state()
+        self.food = self._generate_food()
+        self._write(writes, self._cell(self.food), FOOD)
+        return rng_state
+
+    def _generate_food(self):
+        # same trial and error draws as SimulatorModel.generate_food_position
+        while True:
+            x = self.rng.randint(0, self.width)
+            y = self.rng.randint(0, self.height)
+            if self.grid[x * self.height + y] == EMPTY:
+                return x, y
+
+    def _place_snake(self):
+        self.body.append(START_POSITION)
+        cell = self._cell(START_POSITION)
+        self.grid[cell] = SNAKE
+        self.counts[cell] = 1
+
+    def _write(self, writes, cell, value):
+        writes.append((cell, self.grid[cell]))
+        self.grid[cell] = value
+
+    def _cell(self, position):
+        return position[0] * self.height + position[1]
+
+    def _in_bounds(self, position):
+        return 0 <= position[0] < self.width and 0 <= position[1] < self.height
@@ -1,4 +1,6 @@
 from constants import FOOD_COLOR, SNAKE_COLOR
+from recorder import PALETTE, downsample_indices, render_frame
+import numpy as np
 import pygame
 import time
 
@@ -68,6 +70,147 @@ class Board:
         pygame.draw.rect(self.window, border_color, rect=rect, width=10 if snake else 1)
 
 
+class Viewport:
+
+    MIN_CELL_SIZE = 1
+    MAX_CELL_SIZE = 128
+
+    def __init__(
+        self,
+        window,
+        parent_width,
+        parent_height,
+        width,
+        height,
+        cell_size=None,
+        minimap=True,
+        minimap_size=160,
+        background=(64, 64, 64),
+    ):
+        """
+        - Camera over the board: only the visible cells are rasterized (with numpy, see
+          recorder.render_frame) and blitted in one call, so the cost depends on the
+          window size instead of the board size
+        - Follows the focus cell (the snake head) by default, pans with W/A/S/D (which
+          stops following, F follows again) and zooms with +/- or the mouse wheel
+        - The minimap shows the whole board downsampled, with the visible area outlined
+        :param window: pygame window
+        :param parent_width: viewport width in pixels
+        :param parent_height: viewport height in pixels
+        :param width: board width in cells
+        :param height: board height in cells
+        :param cell_size: initial pixels per cell (default: fit the board, at least 8)
+        :param minimap: draw the minimap in the top right corner while part of the board
+                        is out of view
+        :param minimap_size: largest minimap side in pixels
+        :param background: color around boards smaller than the viewport
+        """
+        self.window = window
+        self.parent_width = parent_width
+        self.parent_height = parent_height
+        self.width = width
+        self.height = height
+        if cell_size is None:
+            cell_size = max(min(parent_width, parent_height) // max(width, height), 8)
+        self.cell_size = cell_size
+        self.minimap = minimap
+        self.minimap_size = minimap_size
+        self.background = background
+        self.center = (width / 2, height / 2)
+        self.following = True
+        # (x, y, columns, rows) of the cells drawn last frame
+        self.visible = (0, 0, width, height)
+        self._surface = None
+
+    def set_focus(self, position):
+        if self.following and position is not None:
+            self.center = (
+                min(max(int(position[0]), 0), self.width - 1) + 0.5,
+                min(max(int(position[1]), 0), self.height - 1) + 0.5,
+            )
+
+    def zoom(self, factor):
+        self.cell_size = int(
+            min(max(self.cell_size * factor, self.MIN_CELL_SIZE), self.MAX_CELL_SIZE)
+        )
+
+    def pan(self, dx, dy):
+        """
+        :param dx: cells to move right
+        :param dy: cells to move down
+        """
+        self.following = False
+        self.center = (
+            min(max(self.center[0] + dx, 0), self.width),
+            min(max(self.center[1] + dy, 0), self.height),
+        )
+
+    def handle_event(self, event):
+        if event.type == pygame.MOUSEWHEEL:
+            self.zoom(2 if event.y > 0 else 0.5)
+        elif event.type == pygame.KEYDOWN:
+            step = max(1, self.visible[2] // 4)
+            if event.key in (pygame.K_PLUS, pygame.K_EQUALS, pygame.K_KP_PLUS):
+                self.zoom(2)
+            elif event.key in (pygame.K_MINUS, pygame.K_KP_MINUS):
+                self.zoom(0.5)
+            elif event.key == pygame.K_a:
+                self.pan(-step, 0)
+            elif event.key == pygame.K_d:
+                self.pan(step, 0)
+            elif event.key == pygame.K_w:
+                self.pan(0, -step)
+            elif event.key == pygame.K_s:
+                self.pan(0, step)
+            elif event.key == pygame.K_f:
+                self.following = not self.following
+
+    def render(self, board_model):
+        size = self.cell_size
+        columns = min(self.width, -(-self.parent_width // size))
+        rows = min(self.height, -(-self.parent_height // size))
+        x = min(max(int(self.center[0] - columns / 2), 0), self.width - columns)
+        y = min(max(int(self.center[1] - rows / 2), 0), self.height - rows)
+        self.visible = (x, y, columns, rows)
+        frame = render_frame(
+            board_model[x : x + columns, y : y + rows], size, borders=size >= 4
+        )
+        # surfarray is indexed [x, y], frames are [row, column]
+        pixels = frame.transpose(1, 0, 2)
+        if self._surface is None or self._surface.get_size() != pixels.shape[:2]:
+            self._surface = pygame.Surface(pixels.shape[:2])
+        pygame.surfarray.blit_array(self._surface, pixels)
+        self.window.fill(self.background)
+        self.window.blit(self._surface, (0, 0))
+        if self.minimap and (columns < self.width or rows < self.height):
+            self.render_minimap(board_model)
+
+    def render_minimap(self, board_model):
+        factor = max(1, -(-max(self.width, self.height) // self.minimap_size))
+        indices = downsample_indices(board_model, factor)
+        scale = max(1, self.minimap_size // max(indices.shape))
+        pixels = PALETTE[np.repeat(np.repeat(indices, scale, axis=0), scale, axis=1)]
+        surface = pygame.surfarray.make_surface(pixels)
+        left = self.parent_width - surface.get_width() - 10
+        top = 10
+        self.window.blit(surface, (left, top))
+        pygame.draw.rect(
+            self.window, (0, 0, 0), surface.get_rect(topleft=(left, top)), width=1
+        )
+        x, y, columns, rows = self.visible
+        pygame.draw.rect(
+            self.window,
+            (0, 0, 255),
+            pygame.Rect(
+                left + x * scale // factor,
+                top + y * scale // factor,
+                max(1, columns * scale // factor),
+                max(1, rows * scale // factor),
+            ),
+            width=1,
+        )
+
+
 class Label:
 
     def __init__(
@@ -102,13 +245,24 @@ class Label:
         self.anti_alias = anti_alias
         self.refresh_count = refresh_count
         self.current_count = 0
+        # rendered text surface, only redrawn when text/color/background change
+        self._surface = None
+        self._surface_key = None
 
         if font is None:
             self.font = pygame.font.Font(pygame.font.get_default_font(), self.size)
 
+    def get_surface(self):
+        key = (self.text, self.color, self.background)
+        if self._surface is None or key != self._surface_key:
+            self._surface = self.font.render(
+                self.text, self.anti_alias, self.color, self.background
+            )
+            self._surface_key = key
+        return self._surface
+
     def render(self, window, position=None):
-        text = self.font.render(self.text, self.anti_alias, self.color, self.background)
-        window.blit(text, self.position if position is None else position)
+        window.blit(self.get_surface(), self.position if position is None else position)
 
     def append_text(self, text, refresh_count=None, append_to_front=False):
         if refresh_count is not None:
@@ -175,10 +329,7 @@ class TimedLabel(Label):
 
     def render(self, window, position=None):
         if (time.time() - self.time_created) < self.timeout:
-            text = self.font.render(
-                self.text, self.anti_alias, self.color, self.background
-            )
-            window.blit(text, self.position)
+            window.blit(self.get_surface(), self.position)
         else:
             self._remove_label()
 
@@ -208,3 +359,59 @@ class TimedLabelQueue:
     def render(self):
         if self.current_label is not None:
             self.current_label.render(self._window)
+
+
+class Hud:
+
+    def __init__(
+        self,
+        position=(10, 10),
+        size=16,
+        color=(0, 0, 0),
+        background=(255, 255, 255),
+        spacing=4,
+    ):
+        """
+        - Column of "name: value" labels drawn on top of the board
+        - Each stat keeps its own Label, so only values that changed get re-rendered
+        :param position: top-left corner of the first label
+        :param size: font size
+        :param color: text color
+        :param background: label background (keeps the text readable over the board)
+        :param spacing: pixels between rows
+        """
+        self.position = position
+        self.size = size
+        self.color = color
+        self.background = background
+        self.spacing = spacing
+        self.font = pygame.font.Font(pygame.font.get_default_font(), self.size)
+        self.labels: dict[str, Label] = {}
+
+    def update(self, stats):
+        """
+        :param stats: map of stat name to display value, None values are skipped
+        """
+        for name, value in stats.items():
+            if value is None:
+                continue
+            label = self.labels.get(name)
+            if label is None:
+                row = len(self.labels)
+                label = Label(
+                    position=(
+                        self.position[0],
+                        self.position[1]
+                        + row * (self.font.get_linesize() + self.spacing),
+                    ),
+                    font=self.font,
+                    color=self.color,
+                    background=self.background,
+                    anti_alias=True,
+                )
+                self.labels[name] = label
+            label.update_text(f"{name}: {value}")
+
+    def render(self, window):
+        for label in self.labels.values():
+            label.render(window)
@@ -1,9 +1,20 @@
-from agent import DefaultAgent
+from agent import DefaultAgent, RandomAgent
 from qlearn import QLearningAgent
+from search import SearchAgent
+from planner import PathPlanningAgent, prefill_replay
 from simulator import SimulatorModel, Simulator
+from recorder import export_episodes
+from distributed import ParameterServer, TransitionOutbox
+from snapshot import latest_snapshot, load_snapshot
+from remote import RemoteAgent
+from autotune import DEFAULT_CONFIG_PATH, apply_thread_settings, autotune, load_config
+from difftrace import verify_traces
+from distill import LOSSES, STUDENTS, distill as distill_policy
 from constants import INPUT_SHAPE, NUM_OUTPUT, VIDEO_INPUT_SHAPE
+from functools import partial
 import argparse
 import logging
+import os
 
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger(__name__)
@@ -11,12 +22,64 @@ log = logging.getLogger(__name__)
 log.info("Starting AI Snake Simulator...")
 
 
-def main(user: bool, headless: bool, model: str | None, training: bool):
+def main(
+    user: bool,
+    headless: bool,
+    model: str | None,
+    training: bool,
+    prioritized_replay: bool = False,
+    action_repeat: int = 1,
+    n_step: int = 1,
+    async_training: bool = False,
+    replay_ratio: float = 1.0,
+    export: int | None = None,
+    export_dir: str = "exports",
+    export_format: str = "gif",
+    learner: str | None = None,
+    actor: str | None = None,
+    resume: bool = False,
+    snapshot_every: int | None = None,
+    agent_type: str = "qlearn",
+    prefill: int | None = None,
+    input_poll_rate: int | None = None,
+    symmetry_augmentation: bool = False,
+    viewport: bool = False,
+    q_cache: int | None = None,
+    remote: bool = False,
+    remote_blocking: bool = True,
+    tune: bool = False,
+    config: str | None = None,
+    memory_budget: float | None = None,
+    verify_trace: int | None = None,
+    trace_steps: int = 1000,
+    distill: int | None = None,
+    student: str = "conv",
+    distill_loss: str = "q",
+):
     assert not (user and headless), "Cannot use both user and headless mode."
-    # step 1 - create an Agent
+    assert not (user and export), "Cannot export episodes in user mode."
+    assert not (learner and actor), "Cannot be both learner and actor."
+    assert not (remote and user), "Cannot run the user agent in another process."
+    assert not (
+        remote and (learner or actor or resume or snapshot_every or prefill)
+    ), "Remote agents cannot be used for distributed training or snapshots."
+    assert not (
+        (resume or snapshot_every) and (user or agent_type != "qlearn")
+    ), "Only the qlearn agent can be snapshotted and resumed."
+    assert not (
+        tune and (user or learner or actor or remote)
+    ), "Autotuning runs its own headless qlearn games."
+    if verify_trace:
+        # check GameState against SimulatorModel + Snake, no agent needed
+        divergence = verify_traces(verify_trace, steps=trace_steps)
+        if divergence is not None:
+            raise SystemExit(str(divergence))
+        return
+    # step 1 - create an Agent (factories are picklable for remote agents)
     agent_map = {
-        "user": DefaultAgent(INPUT_SHAPE, 4),
-        "qlearn": QLearningAgent(
+        "user": partial(DefaultAgent, INPUT_SHAPE, 4),
+        "qlearn": partial(
+            QLearningAgent,
             alpha=0.01,
             alpha_decay=0.01,
             y=0.6,
@@ -27,23 +90,124 @@ def main(user: bool, headless: bool, model: str | None, training: bool):
             replay_mem_max=500,
             save_after=100,
             load_latest_model=False,
-            training_model=training,
+            training_model=training or actor is not None,
             model_path=model,
             train_each_step=False,
             debug=False,
+            prioritized_replay=prioritized_replay,
+            action_repeat=action_repeat,
+            n_step=n_step,
+            async_training=async_training,
+            replay_ratio=replay_ratio,
+            remote_learner=actor is not None,
+            symmetry_augmentation=symmetry_augmentation,
+            q_cache_size=q_cache,
         ),
+        "search": partial(SearchAgent, INPUT_SHAPE, NUM_OUTPUT, depth=4),
+        "path": partial(PathPlanningAgent, INPUT_SHAPE, NUM_OUTPUT),
+        "random": partial(RandomAgent, INPUT_SHAPE, NUM_OUTPUT),
     }
-    agent = agent_map["user" if user else "qlearn"]
+    if tune:
+        autotune(
+            agent_map["qlearn"].keywords,
+            INPUT_SHAPE[0],
+            INPUT_SHAPE[1],
+            path=config or DEFAULT_CONFIG_PATH,
+            memory_budget_mb=memory_budget,
+        )
+        return
+    if distill:
+        assert model is not None, "Distillation needs a trained teacher (--model)."
+        distill_policy(
+            agent_map["qlearn"],
+            distill,
+            INPUT_SHAPE[0],
+            INPUT_SHAPE[1],
+            kind=student,
+            loss=distill_loss,
+        )
+        return
+    if config:
+        settings = load_config(config)
+        apply_thread_settings(settings)
+        agent_map["qlearn"] = partial(
+            agent_map["qlearn"],
+            batch_size=settings["batch_size"],
+            train_every=settings["train_every"],
+        )
+        log.info(
+            f"Loaded {config}, {settings['num_games']} parallel games "
+            f"(e.g. --actor processes) recommended."
+        )
+    agent_factory = agent_map["user" if user else agent_type]
+    if remote:
+        # search and path agents read the SimulatorModel directly
+        assert agent_type in (
+            "qlearn",
+            "random",
+        ), f"The {agent_type} agent cannot run in another process."
+        agent = RemoteAgent(
+            INPUT_SHAPE, NUM_OUTPUT, agent_factory, blocking=remote_blocking
+        )
+    else:
+        agent = agent_factory()
+    if prefill:
+        assert isinstance(
+            agent, QLearningAgent
+        ), "Only the qlearn agent has a replay memory."
+        prefill_replay(agent, prefill, INPUT_SHAPE[0], INPUT_SHAPE[1])
+    if learner:
+        # parameter server process: trains on batches streamed in by actors
+        host, port = learner.rsplit(":", 1)
+        server = ParameterServer(agent, host=host, port=int(port))
+        try:
+            server.serve()
+        except KeyboardInterrupt:
+            pass
+        agent.save_model("latest.weights.h5")
+        return
+    if actor:
+        # explore with the learner's weights and stream experiences back
+        host, port = actor.rsplit(":", 1)
+        agent.replay_memory = TransitionOutbox(
+            agent, host, int(port), name=str(os.getpid())
+        )
+        agent.replay_memory.client.connect()
+        headless = True
     # step 2 - create a SimulatorModel
     model = SimulatorModel(
-        INPUT_SHAPE[0], INPUT_SHAPE[1], agent=agent, debug=True, max_iterations=500
+        INPUT_SHAPE[0],
+        INPUT_SHAPE[1],
+        agent=agent,
+        debug=True,
+        max_iterations=500,
+        snapshot_every=snapshot_every,
     )
     agent.set_simulator(simulator=model)
+    if resume:
+        path = latest_snapshot()
+        if path is None:
+            log.warning("No snapshot to resume from, starting fresh.")
+        else:
+            load_snapshot(model, path)
     # step 3 - create a Simulator
-    if not headless:
+    if export:
+        # frames are rendered with numpy, so no window is ever needed
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        export_episodes(model, export, export_dir, fmt=export_format)
+        agent.close()
+    elif not headless:
         simulator = Simulator(
-            width=800, height=800, model=model, fps=10, caption="AI Snake Simulator"
+            width=800,
+            height=800,
+            model=model,
+            fps=10,
+            caption="AI Snake Simulator",
+            input_poll_rate=input_poll_rate,
+            viewport=viewport,
         )
+        if user:
+            agent.set_input_queue(simulator.input_queue)
         simulator.start()
     else:
         model.start_headless_simulation()
@@ -74,5 +238,210 @@ if __name__ == "__main__":
         help="Whether to train the model",
         default=False,
     )
+    parser.add_argument(
+        "--prioritized-replay",
+        action="store_true",
+        help="Sample replay memory by TD-error priority",
+        default=False,
+    )
+    parser.add_argument(
+        "--action-repeat",
+        type=int,
+        help="Number of steps each chosen action is repeated for",
+        default=1,
+    )
+    parser.add_argument(
+        "--n-step",
+        type=int,
+        help="Number of decisions folded into each replay target",
+        default=1,
+    )
+    parser.add_argument(
+        "--async-training",
+        action="store_true",
+        help="Train on a background thread while the simulation keeps running",
+        default=False,
+    )
+    parser.add_argument(
+        "--replay-ratio",
+        type=float,
+        help="Maximum async training updates per environment step",
+        default=1.0,
+    )
+    parser.add_argument(
+        "--export",
+        type=int,
+        help="Render this many episodes headlessly to files instead of running",
+        default=None,
+    )
+    parser.add_argument(
+        "--export-dir",
+        help="Directory for exported episodes",
+        default="exports",
+    )
+    parser.add_argument(
+        "--export-format",
+        choices=["gif", "rgb"],
+        help="Animated GIF or raw rgb24 frames",
+        default="gif",
+    )
+    parser.add_argument(
+        "--learner",
+        metavar="HOST:PORT",
+        help="Run as the learner/parameter server for remote actors",
+        default=None,
+    )
+    parser.add_argument(
+        "--actor",
+        metavar="HOST:PORT",
+        help="Run headless as an actor streaming experiences to a learner",
+        default=None,
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Resume from the latest training snapshot",
+        default=False,
+    )
+    parser.add_argument(
+        "--snapshot-every",
+        type=int,
+        help="Save a full training snapshot every n episodes",
+        default=None,
+    )
+    parser.add_argument(
+        "--agent",
+        choices=["qlearn", "search", "path", "random"],
+        help="Agent to run when not in user mode",
+        default="qlearn",
+    )
+    parser.add_argument(
+        "--prefill",
+        type=int,
+        help="Fill the replay memory with this many path planner transitions first",
+        default=None,
+    )
+    parser.add_argument(
+        "--input-poll-rate",
+        type=int,
+        help="Keyboard polls per second in user mode (default: once per step)",
+        default=None,
+    )
+    parser.add_argument(
+        "--symmetry-augmentation",
+        action="store_true",
+        help="Train on every rotation/reflection of each sampled transition",
+        default=False,
+    )
+    parser.add_argument(
+        "--viewport",
+        action="store_true",
+        help="Zoomable camera that follows the snake (W/A/S/D pan, F follow, +/- zoom)",
+        default=False,
+    )
+    parser.add_argument(
+        "--q-cache",
+        type=int,
+        metavar="ENTRIES",
+        help="Cache Q values of this many recently seen observations",
+        default=None,
+    )
+    parser.add_argument(
+        "--remote",
+        action="store_true",
+        help="Run the agent in its own process, observations go through shared memory",
+        default=False,
+    )
+    parser.add_argument(
+        "--remote-nonblocking",
+        action="store_true",
+        help="With --remote, keep stepping with the latest action instead of waiting",
+        default=False,
+    )
+    parser.add_argument(
+        "--autotune",
+        action="store_true",
+        help="Time short headless trials to pick threads, batch size, train-every and "
+        "number of games, then write them to --config",
+        default=False,
+    )
+    parser.add_argument(
+        "--config",
+        help=f"Settings written by --autotune (default path {DEFAULT_CONFIG_PATH})",
+        default=None,
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=float,
+        metavar="MB",
+        help="Peak memory allowed per autotune trial (default: half the RAM)",
+        default=None,
+    )
+    parser.add_argument(
+        "--verify-trace",
+        type=int,
+        metavar="TRACES",
+        help="Compare GameState with the reference engine on this many traces and exit",
+        default=None,
+    )
+    parser.add_argument(
+        "--trace-steps",
+        type=int,
+        help="Steps per --verify-trace trace",
+        default=1000,
+    )
+    parser.add_argument(
+        "--distill",
+        type=int,
+        metavar="STATES",
+        help="Distill the --model teacher into a small student on this many states, "
+        "saved as student.keras",
+        default=None,
+    )
+    parser.add_argument(
+        "--student",
+        choices=STUDENTS,
+        help="Student network for --distill",
+        default="conv",
+    )
+    parser.add_argument(
+        "--distill-loss",
+        choices=LOSSES,
+        help="Match the teacher's Q values or its action distribution",
+        default="q",
+    )
     args = parser.parse_args()
-    main(args.user, args.headless, args.model, args.training)
+    main(
+        args.user,
+        args.headless,
+        args.model,
+        args.training,
+        prioritized_replay=args.prioritized_replay,
+        action_repeat=args.action_repeat,
+        n_step=args.n_step,
+        async_training=args.async_training,
+        replay_ratio=args.replay_ratio,
+        export=args.export,
+        export_dir=args.export_dir,
+        export_format=args.export_format,
+        learner=args.learner,
+        actor=args.actor,
+        resume=args.resume,
+        snapshot_every=args.snapshot_every,
+        agent_type=args.agent,
+        prefill=args.prefill,
+        input_poll_rate=args.input_poll_rate,
+        symmetry_augmentation=args.symmetry_augmentation,
+        viewport=args.viewport,
+        q_cache=args.q_cache,
+        remote=args.remote or args.remote_nonblocking,
+        remote_blocking=not args.remote_nonblocking,
+        tune=args.autotune,
+        config=args.config,
+        memory_budget=args.memory_budget,
+        verify_trace=args.verify_trace,
+        trace_steps=args.trace_steps,
+        distill=args.distill,
+        student=args.student,
+        distill_loss=args.distill_loss,
+    )
@@ -0,0 +1,342 @@
+from agent import Agent
+from constants import FOOD_COLOR, SNAKE_COLOR, VIDEO_FRAMES
+from experience import arrays_to_experiences
+from gamestate import DIRECTIONS, GameState
+from collections import deque
+import heapq
+import numpy as np
+import time
+import logging
+
+log = logging.getLogger(__name__)
+
+UNREACHABLE = 1 << 30
+# GameState grid values (EMPTY, SNAKE, FOOD) to board colors
+_BOARD_COLORS = np.array([0, SNAKE_COLOR, FOOD_COLOR], dtype=np.int8)
+
+
+class DistanceField:
+
+    def __init__(self, width, height):
+        """
+        - Shortest path distance from every cell to a source cell (the food), avoiding
+          blocked cells (the snake)
+        - Kept up to date incrementally as cells are blocked and unblocked: unblocking
+          propagates shorter distances outwards, blocking only recomputes the cells whose
+          every shortest path ran through the blocked cell (Ramalingam-Reps)
+        - Moving the source means a full BFS, which only happens when food is eaten
+        :param width: cells across
+        :param height: cells upwards
+        """
+        self.width = width
+        self.height = height
+        self.size = width * height
+        self.blocked = bytearray(self.size)
+        self.dist = [UNREACHABLE] * self.size
+        self.source = None
+        self.neighbors = []
+        for x in range(width):
+            for y in range(height):
+                self.neighbors.append(
+                    tuple(
+                        (x + dx) * height + y + dy
+                        for dx, dy in DIRECTIONS
+                        if 0 <= x + dx < width and 0 <= y + dy < height
+                    )
+                )
+        # stats
+        self.recomputes = 0
+        self.updates = 0
+
+    def set_source(self, cell):
+        if cell != self.source:
+            self.source = cell
+            self.recompute()
+
+    def sync(self, blocked):
+        """
+        - Block and unblock cells until the field matches the given mask
+        :param blocked: flat boolean array (width * height)
+        """
+        current = np.frombuffer(self.blocked, dtype=np.uint8).astype(bool)
+        changed = np.flatnonzero(current != blocked)
+        for cell in changed[current[changed]].tolist():
+            self.unblock(cell)
+        for cell in changed[~current[changed]].tolist():
+            self.block(cell)
+
+    def recompute(self):
+        dist = [UNREACHABLE] * self.size
+        if self.source is not None:
+            dist[self.source] = 0
+            queue = deque([self.source])
+            while queue:
+                u = queue.popleft()
+                d = dist[u] + 1
+                for v in self.neighbors[u]:
+                    if d < dist[v] and not self.blocked[v]:
+                        dist[v] = d
+                        queue.append(v)
+        self.dist = dist
+        self.recomputes += 1
+
+    def block(self, cell):
+        blocked, dist, neighbors = self.blocked, self.dist, self.neighbors
+        if blocked[cell]:
+            return
+        blocked[cell] = 1
+        if cell == self.source or dist[cell] == UNREACHABLE:
+            return
+        self.updates += 1
+        # cells that lose every parent, found in BFS (= distance) order
+        affected = {cell}
+        order = [cell]
+        for u in order:
+            d = dist[u] + 1
+            for v in neighbors[u]:
+                if dist[v] != d or v in affected or blocked[v]:
+                    continue
+                if not any(
+                    dist[w] == dist[v] - 1 and w not in affected for w in neighbors[v]
+                ):
+                    affected.add(v)
+                    order.append(v)
+        for u in order:
+            dist[u] = UNREACHABLE
+        # rebuild them from the unaffected boundary
+        heap = []
+        for u in order[1:]:
+            best = min(dist[w] for w in neighbors[u])
+            if best < UNREACHABLE:
+                heapq.heappush(heap, (best + 1, u))
+        while heap:
+            d, u = heapq.heappop(heap)
+            if d >= dist[u]:
+                continue
+            dist[u] = d
+            for v in neighbors[u]:
+                if d + 1 < dist[v] and not blocked[v]:
+                    heapq.heappush(heap, (d + 1, v))
+
+    def unblock(self, cell):
+        blocked, dist, neighbors = self.blocked, self.dist, self.neighbors
+        if not blocked[cell]:
+            return
+        blocked[cell] = 0
+        if cell == self.source:
+            return
+        self.updates += 1
+        best = min(dist[w] for w in neighbors[cell]) + 1
+        if best >= dist[cell]:
+            return
+        dist[cell] = best
+        queue = deque([cell])
+        while queue:
+            u = queue.popleft()
+            d = dist[u] + 1
+            for v in neighbors[u]:
+                if d < dist[v] and not blocked[v]:
+                    dist[v] = d
+                    queue.append(v)
+
+
+class PathPlanner:
+
+    def __init__(self, width, height):
+        """
+        - Greedy shortest path towards the food with a flood fill safety check
+        - A move is only taken if the area it leads into can hold the whole snake,
+          otherwise the planner falls back to the move with the most room
+        """
+        self.width = width
+        self.height = height
+        self.field = DistanceField(width, height)
+        self.decisions = 0
+        self.plan_time = 0.0
+
+    def plan(self, state):
+        """
+        :param state: GameState at the start of a step
+        :return: action 0 - 3
+        """
+        start = time.perf_counter()
+        action = self._plan(state)
+        self.decisions += 1
+        self.plan_time += time.perf_counter() - start
+        return action
+
+    def _plan(self, state):
+        field = self.field
+        field.sync(np.frombuffer(state.counts, dtype=np.uint8) > 0)
+        field.set_source(state.food[0] * self.height + state.food[1])
+        hx, hy = state.head
+        if not (0 <= hx < self.width and 0 <= hy < self.height):
+            return state.direction
+        food, _, _ = state.status()
+        tail = state.body[-1]
+        # the tail moves out of the way unless the snake grows this step
+        free_tail = None if food else tail[0] * self.height + tail[1]
+        moves = []
+        for action, (dx, dy) in enumerate(DIRECTIONS):
+            x, y = hx + dx, hy + dy
+            if not (0 <= x < self.width and 0 <= y < self.height):
+                continue
+            cell = x * self.height + y
+            if field.blocked[cell] and cell != free_tail:
+                continue
+            moves.append((field.dist[cell], action, cell))
+        if not moves:
+            return state.direction
+        moves.sort()
+        for distance, action, cell in moves:
+            if distance == UNREACHABLE:
+                break
+            if self._room(cell, free_tail, state.length) >= state.length:
+                return action
+        return max(moves, key=lambda m: self._room(m[2], free_tail, self.field.size))[1]
+
+    def _room(self, start, free_tail, limit):
+        """
+        - Flood fill from start, stopping once limit cells were reached
+        """
+        blocked, neighbors = self.field.blocked, self.field.neighbors
+        seen = {start}
+        queue = deque([start])
+        while queue and len(seen) < limit:
+            u = queue.popleft()
+            for v in neighbors[u]:
+                if v not in seen and (not blocked[v] or v == free_tail):
+                    seen.add(v)
+                    queue.append(v)
+        return len(seen)
+
+
+class PathPlanningAgent(Agent):
+
+    def __init__(self, input_shape: tuple[int, int], num_outputs: int):
+        """
+        - Built-in heuristic player, see PathPlanner
+        :param input_shape: board size (width, height)
+        """
+        super().__init__(input_shape, num_outputs, training=False)
+        self.planner = PathPlanner(*input_shape)
+
+    def update(
+        self, inputs, reward_collision=False, wall_collision=False, keys_pressed=None
+    ):
+        if wall_collision:
+            return 4
+        return self.planner.plan(GameState.from_model(self._simulator))
+
+    def close(self):
+        planner, field = self.planner, self.planner.field
+        if planner.decisions:
+            log.info(
+                f"Planner: {planner.decisions} decisions, "
+                f"{1e6 * planner.plan_time / planner.decisions:.0f}us per decision, "
+                f"{field.recomputes} full and {field.updates} incremental field updates."
+            )
+
+    def save_model(self, path):
+        pass
+
+    def load_model(self, path):
+        pass
+
+
+def generate_transitions(agent, num_transitions, width, height, chunk_size=4096):
+    """
+    - Play headless GameState games with the PathPlanner and yield the transitions a
+      QLearningAgent would have recorded, as experiences_to_arrays style chunks
+    - Frames are built straight from the GameState grid into preallocated int8 arrays
+    - Rewards, the frame stack and the no-food timeout follow QLearningAgent
+    :param agent: QLearningAgent the transitions are meant for
+    :param num_transitions: total number of transitions
+    :param chunk_size: transitions per yielded chunk
+    """
+    params = agent._qlearn_params
+    timeout = agent.input_shape[0] * agent.input_shape[1]
+    planner = PathPlanner(width, height)
+    state = None
+    produced = 0
+    while produced < num_transitions:
+        size = min(chunk_size, num_transitions - produced)
+        states = np.empty((size, width, height * VIDEO_FRAMES, 1), dtype=np.int8)
+        next_states = np.empty_like(states)
+        actions = np.empty(size, dtype=np.int8)
+        rewards = np.empty(size, dtype=np.float64)
+        i = 0
+        while i < size:
+            if state is None:
+                state = GameState(width, height)
+                frames = None
+                previous = None
+                steps_without_food = 0
+            frame = _BOARD_COLORS[
+                np.frombuffer(state.grid, dtype=np.uint8).reshape(width, height)
+            ]
+            if frames is None:
+                frames = deque([frame] * VIDEO_FRAMES, maxlen=VIDEO_FRAMES)
+            else:
+                frames.append(frame)
+            current = np.concatenate(frames, axis=1)[..., None]
+            food, wall_hit, snake_hit = state.status()
+            episode_end = wall_hit or snake_hit
+            if wall_hit:
+                reward = params.wall
+            elif snake_hit:
+                reward = params.snake_hit
+            elif food:
+                reward = params.reward
+                steps_without_food = 0
+            else:
+                reward = params.other
+                steps_without_food += 1
+                if steps_without_food >= timeout:
+                    reward += params.wall
+                    episode_end = True
+            if previous is not None:
+                states[i], actions[i] = previous
+                rewards[i] = reward
+                next_states[i] = current
+                i += 1
+            if episode_end:
+                state = None
+                continue
+            action = planner.plan(state)
+            state.apply(action)
+            state.commit()
+            previous = (current, action)
+        produced += size
+        yield {
+            "states": states,
+            "actions": actions,
+            "rewards": rewards,
+            "next_states": next_states,
+            "n_steps": np.ones(size, dtype=np.int16),
+        }
+
+
+def prefill_replay(agent, num_transitions, width, height, chunk_size=4096):
+    """
+    - Fill a QLearningAgent's replay memory with PathPlanner transitions before training
+    - A bounded memory only keeps its most recent max_size experiences, so no more than
+      that are generated
+    :return: number of transitions added
+    """
+    max_size = agent.replay_memory._max_size
+    if max_size is not None and num_transitions > max_size:
+        log.info(f"Replay memory holds {max_size} experiences, prefilling only those.")
+        num_transitions = max_size
+    start = time.perf_counter()
+    for arrays in generate_transitions(
+        agent, num_transitions, width, height, chunk_size=chunk_size
+    ):
+        for experience in arrays_to_experiences(arrays):
+            agent.replay_memory.add_experience(experience)
+    elapsed = time.perf_counter() - start
+    log.info(
+        f"Prefilled replay memory with {num_transitions} transitions in {elapsed:.2f}s "
+        f"({num_transitions / max(elapsed, 1e-9):.0f}/s)."
+    )
+    return num_transitions
@@ -2,35 +2,90 @@
 from tensorflow.keras.layers import Dense, InputLayer, Conv2D, Flatten
 from tensorflow.keras.optimizers import Adam
 from tensorflow.keras import Sequential
+from tensorflow.keras.models import clone_model, load_model as load_keras_model
 
 # standard library
+from collections import OrderedDict, deque
+from contextlib import nullcontext
+import hashlib
 import os
+import threading
 import time
 
 # others
 from agent import Agent
+from constants import VIDEO_FRAMES
+from experience import Experience, arrays_to_experiences, experiences_to_arrays
+from symmetry import augment_batch
 import numpy as np
 import logging
 
 log = logging.getLogger(__name__)
 
 
-class Experience:
+class NStepAccumulator:
+    """
+    - Folds consecutive one-step transitions into n-step experiences
+    - Reward becomes r_t + y * r_t+1 + ... + y^(n-1) * r_t+n-1 and next_state is n decisions ahead
+    - Pending transitions are flushed with truncated returns when an episode ends
+    """
 
-    def __init__(
-        self, current_state, current_action, resulting_reward, resulting_state
-    ):
+    def __init__(self, n: int, y: float):
+        assert n >= 1, "n must be at least 1"
+        self.n: int = n
+        self.y: float = y
+        self._pending: deque = deque()
+
+    def add(self, state, action, reward, next_state) -> list[Experience]:
+        self._pending.append((state, action, reward))
+        if len(self._pending) < self.n:
+            return []
+        experience = self._fold(next_state)
+        self._pending.popleft()
+        return [experience]
+
+    def flush(self, next_state) -> list[Experience]:
+        experiences = []
+        while self._pending:
+            experiences.append(self._fold(next_state))
+            self._pending.popleft()
+        return experiences
+
+    def get_state(self):
         """
-        Holds the memory for replay
-        :param current_state: the current state of the model
-        :param current_action: the action that was chosen
-        :param res_reward: the resulting reward
-        :param res_state: the resulting state
+        - Pending (not yet folded) transitions as arrays, for snapshots
         """
-        self.current_state: np.ndarray = current_state
-        self.current_action: int = current_action
-        self.res_reward: int = resulting_reward
-        self.next_state: np.ndarray = resulting_state
+        if not self._pending:
+            return {}
+        states, actions, rewards = zip(*self._pending)
+        return {
+            "states": np.concatenate(states),
+            "actions": np.array(actions, dtype=np.int64),
+            "rewards": np.array(rewards, dtype=np.float64),
+        }
+
+    def set_state(self, arrays):
+        self._pending.clear()
+        if arrays:
+            for i in range(len(arrays["actions"])):
+                self._pending.append(
+                    (
+                        arrays["states"][i : i + 1],
+                        int(arrays["actions"][i]),
+                        float(arrays["rewards"][i]),
+                    )
+                )
+
+    def _fold(self, next_state) -> Experience:
+        state, action, _ = self._pending[0]
+        reward = sum(self.y**i * r for i, (_, _, r) in enumerate(self._pending))
+        return Experience(
+            current_state=state,
+            current_action=action,
+            resulting_reward=reward,
+            resulting_state=next_state,
+            n_steps=len(self._pending),
+        )
 
 
 class ReplayMemory:
@@ -43,17 +98,423 @@ class ReplayMemory:
         self._max_size: int | None = max_size
         self._arr: list[Experience] = []
         self._size: int = 0
+        # the async learner samples while the simulation thread adds experiences
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return self._size
+
+    def add_experience(self, ex: Experience):
+        with self._lock:
+            if self._size == self._max_size and self._max_size is not None:
+                self._arr.pop(0)
+                self._size -= 1
+            self._arr.append(ex)
+            self._size += 1
+
+    def get_random_experiences(self, num_samples, rng=None):
+        rng = np.random if rng is None else rng
+        with self._lock:
+            rng.shuffle(self._arr)
+            return self._arr[
+                0 : num_samples if num_samples < self._size else self._size
+            ]
+
+    def sample(self, num_samples, rng=None):
+        """
+        - Uniform sampling, shaped like PrioritizedReplayMemory.sample
+        :param rng: RandomState to sample with, defaults to the global np.random state
+        :return: (experiences, indices, importance sampling weights)
+        """
+        return self.get_random_experiences(num_samples, rng), None, None
+
+    def update_priorities(self, indices, td_errors):
+        """
+        - Uniform replay has no priorities
+        """
+        pass
+
+    def close(self):
+        pass
+
+    def get_state(self):
+        """
+        - Contents as raw arrays plus json-able metadata, for snapshots
+        :return: (arrays, meta)
+        """
+        with self._lock:
+            arrays = experiences_to_arrays(self._arr) if self._size else {}
+            return arrays, {"size": self._size}
+
+    def set_state(self, arrays, meta):
+        with self._lock:
+            self._arr = arrays_to_experiences(arrays) if meta["size"] else []
+            self._size = meta["size"]
+
+
+class SumTree:
+    """
+    - Binary segment tree over leaf priorities stored in a flat numpy array
+    - Leaves live in [capacity, 2 * capacity), node i holds the sum of its children
+    - Updates and sampling walk the tree level by level for a whole batch at once,
+      so both cost O(batch * log n) numpy work
+    """
+
+    def __init__(self, capacity: int):
+        # round up to a power of two so every leaf sits at the same depth
+        self.depth: int = max(1, int(np.ceil(np.log2(capacity))))
+        self.capacity: int = 1 << self.depth
+        self._tree: np.ndarray = np.zeros(2 * self.capacity, dtype=np.float64)
+
+    @property
+    def total(self) -> float:
+        return self._tree[1]
+
+    def get(self, indices):
+        return self._tree[np.asarray(indices) + self.capacity]
+
+    def set(self, index: int, priority: float):
+        """
+        - Scalar version of update, avoids numpy overhead when adding one experience
+        """
+        node = index + self.capacity
+        change = priority - self._tree[node]
+        while node >= 1:
+            self._tree[node] += change
+            node //= 2
+
+    def update(self, indices, priorities):
+        """
+        - Set leaf priorities and refresh the sums on the path to the root
+        :param indices: leaf indices
+        :param priorities: new (non-negative) priorities
+        """
+        nodes = np.asarray(indices, dtype=np.int64) + self.capacity
+        self._tree[nodes] = priorities
+        for _ in range(self.depth):
+            nodes = np.unique(nodes // 2)
+            self._tree[nodes] = self._tree[2 * nodes] + self._tree[2 * nodes + 1]
+
+    def find(self, values):
+        """
+        - Find the leaf whose cumulative priority range contains each value
+        :param values: numpy array of values in [0, total)
+        :return: numpy array of leaf indices
+        """
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        for _ in range(self.depth):
+            left = 2 * nodes
+            left_sum = self._tree[left]
+            go_right = values > left_sum
+            values = np.where(go_right, values - left_sum, values)
+            nodes = left + go_right
+        return nodes - self.capacity
+
+
+class PrioritizedReplayMemory(ReplayMemory):
+    """
+    - Proportional prioritized experience replay (Schaul et al.)
+    - Experiences are kept in preallocated ring arrays, their priorities in a SumTree
+    - Boards only hold -1, 0 and 1, so states are stored as int8: a 10 x 40 state pair
+      takes 800 bytes, about 800MB for 10^6 experiences
+    - New experiences get the highest priority seen so far so they are replayed at least once
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        alpha: float = 0.6,
+        beta: float = 0.4,
+        beta_increment: float = 0.001,
+        epsilon: float = 1e-6,
+    ):
+        assert max_size is not None, "Prioritized replay requires a max_size"
+        super().__init__(max_size=max_size)
+        self.alpha: float = alpha
+        self.beta: float = beta
+        self.beta_increment: float = beta_increment
+        self.epsilon: float = epsilon
+        # state arrays are allocated with the first experience, once their shape is known
+        self._states: np.ndarray | None = None
+        self._next_states: np.ndarray | None = None
+        self._actions: np.ndarray = np.zeros(max_size, dtype=np.int8)
+        self._rewards: np.ndarray = np.zeros(max_size, dtype=np.float64)
+        self._n_steps: np.ndarray = np.zeros(max_size, dtype=np.int16)
+        # bumped on every write, so priorities computed for a slot's previous
+        # experience are not applied to the one that replaced it
+        self._generations: np.ndarray = np.zeros(max_size, dtype=np.int64)
+        self._tree: SumTree = SumTree(max_size)
+        self._next: int = 0
+        self._max_priority: float = 1.0
+
+    def _allocate(self, shape):
+        self._states = np.zeros((self._max_size, *shape), dtype=np.int8)
+        self._next_states = np.zeros_like(self._states)
+
+    def _arrays(self, indices):
+        """
+        - Rows of the ring arrays in the experiences_to_arrays format
+        """
+        return {
+            "states": self._states[indices],
+            "actions": self._actions[indices],
+            "rewards": self._rewards[indices],
+            "next_states": self._next_states[indices],
+            "n_steps": self._n_steps[indices],
+        }
 
     def add_experience(self, ex: Experience):
-        if self._size == self._max_size and self._max_size is not None:
-            self._arr.pop(0)
-            self._size -= 1
-        self._arr.append(ex)
-        self._size += 1
+        with self._lock:
+            if self._states is None:
+                self._allocate(ex.current_state.shape[1:])
+            i = self._next
+            self._states[i] = ex.current_state[0]
+            self._next_states[i] = ex.next_state[0]
+            self._actions[i] = ex.current_action
+            self._rewards[i] = ex.res_reward
+            self._n_steps[i] = ex.n_steps
+            self._generations[i] += 1
+            self._tree.set(i, self._max_priority**self.alpha)
+            self._next = (i + 1) % self._max_size
+            self._size = min(self._size + 1, self._max_size)
+
+    def get_random_experiences(self, num_samples, rng=None):
+        return self.sample(num_samples, rng)[0]
+
+    def sample(self, num_samples, rng=None):
+        """
+        - Stratified sampling proportional to priority
+        :param rng: RandomState to sample with, defaults to the global np.random state
+        :return: (experiences, (slots, write generations), importance sampling weights)
+        """
+        rng = np.random if rng is None else rng
+        with self._lock:
+            if self._size == 0:
+                return [], None, None
+            total = self._tree.total
+            segment = total / num_samples
+            values = (np.arange(num_samples) + rng.rand(num_samples)) * segment
+            indices = self._tree.find(np.minimum(values, np.nextafter(total, 0)))
+            # guard against floating point drift landing on an empty leaf
+            indices = np.minimum(indices, self._size - 1)
+            probabilities = self._tree.get(indices) / total
+            weights = (self._size * probabilities) ** -self.beta
+            weights /= weights.max()
+            self.beta = min(1.0, self.beta + self.beta_increment)
+            arrays = self._arrays(indices)
+            generations = self._generations[indices]
+        return arrays_to_experiences(arrays), (indices, generations), weights
+
+    def update_priorities(self, indices, td_errors):
+        """
+        - Slots overwritten since they were sampled keep the priority of their new
+          experience, the async learner trains without holding the lock
+        :param indices: (slots, write generations) as returned by sample
+        """
+        if indices is None:
+            return
+        slots, generations = indices
+        priorities = np.abs(td_errors) + self.epsilon
+        with self._lock:
+            current = self._generations[slots] == generations
+            if not current.any():
+                return
+            priorities = priorities[current]
+            self._max_priority = max(self._max_priority, float(priorities.max()))
+            self._tree.update(slots[current], priorities**self.alpha)
+
+    def get_state(self):
+        with self._lock:
+            arrays = self._arrays(np.arange(self._size)) if self._size else {}
+            arrays["priorities"] = self._tree.get(np.arange(self._size))
+            meta = {
+                "size": self._size,
+                "next": self._next,
+                "max_priority": self._max_priority,
+                "beta": self.beta,
+            }
+            return arrays, meta
+
+    def set_state(self, arrays, meta):
+        with self._lock:
+            size = meta["size"]
+            self._states = None
+            self._next_states = None
+            if size:
+                self._allocate(arrays["states"].shape[1:])
+                self._states[:size] = arrays["states"]
+                self._next_states[:size] = arrays["next_states"]
+                self._actions[:size] = arrays["actions"]
+                self._rewards[:size] = arrays["rewards"]
+                self._n_steps[:size] = arrays["n_steps"]
+            self._generations += 1
+            self._tree = SumTree(self._max_size)
+            self._tree.update(np.arange(size), arrays["priorities"])
+            self._size = size
+            self._next = meta["next"]
+            self._max_priority = meta["max_priority"]
+            self.beta = meta["beta"]
+
+
+class AsyncLearner(threading.Thread):
+    """
+    - Trains a copy of the agent's network on a background thread
+    - The simulation keeps stepping with the acting network, which picks up the
+      learner's weights every sync_every updates
+    - replay_ratio caps training at that many updates per environment step
+    """
+
+    def __init__(self, agent, replay_ratio: float = 1.0, sync_every: int = 10):
+        super().__init__(name="AsyncLearner", daemon=True)
+        self.replay_ratio: float = replay_ratio
+        self.sync_every: int = sync_every
+        self.updates: int = 0
+        self._agent = agent
+        self._model = clone_model(agent._model)
+        self._model.set_weights(agent._model.get_weights())
+        agent._compile_model(self._model)
+        # sampling must not share the global np.random stream with the acting thread
+        self._rng = np.random.RandomState()
+        self._env_steps = 0
+        self._stopped = False
+        self._condition = threading.Condition()
+        # held for each training update, see paused
+        self._train_lock = threading.Lock()
+        self._weights_lock = threading.Lock()
+        self._pending_weights = None
 
-    def get_random_experiences(self, num_samples):
-        np.random.shuffle(self._arr)
-        return self._arr[0 : num_samples if num_samples < self._size else self._size]
+    def notify_step(self):
+        with self._condition:
+            self._env_steps += 1
+            self._condition.notify()
+
+    def pull_weights(self):
+        """
+        - Hand the latest published weights to the acting thread (at most once)
+        :return: list of weight arrays or None
+        """
+        with self._weights_lock:
+            weights = self._pending_weights
+            self._pending_weights = None
+        return weights
+
+    def run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(self._can_train)
+                if self._stopped:
+                    return
+            with self._train_lock:
+                self._agent._train_model(model=self._model, rng=self._rng)
+                self.updates += 1
+                if self.updates % self.sync_every == 0:
+                    self._publish()
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self.join()
+        self._publish()
+
+    def paused(self):
+        """
+        - Context manager that waits for the current update to finish and keeps the
+          learner from training until it exits, e.g. while its network, optimizer and
+          the replay memory are being read or restored
+        """
+        return self._train_lock
+
+    def get_state(self):
+        """
+        - Update counters and the sampling RNG, call while paused
+        :return: (arrays, meta)
+        """
+        rng_name, rng_keys, rng_pos, rng_has_gauss, rng_gauss = self._rng.get_state()
+        with self._condition:
+            env_steps = self._env_steps
+        meta = {
+            "updates": self.updates,
+            "env_steps": env_steps,
+            "rng": [rng_name, rng_pos, rng_has_gauss, rng_gauss],
+        }
+        return {"rng_keys": rng_keys}, meta
+
+    def set_state(self, arrays, meta):
+        """
+        - Restore get_state output, call while paused
+        """
+        rng_name, rng_pos, rng_has_gauss, rng_gauss = meta["rng"]
+        self._rng.set_state(
+            (rng_name, arrays["rng_keys"], rng_pos, rng_has_gauss, rng_gauss)
+        )
+        with self._condition:
+            self.updates = meta["updates"]
+            self._env_steps = meta["env_steps"]
+            self._condition.notify()
+
+    def _can_train(self):
+        return self._stopped or (
+            len(self._agent.replay_memory) > 0
+            and self.updates < self._env_steps * self.replay_ratio
+        )
+
+    def _publish(self):
+        weights = self._model.get_weights()
+        with self._weights_lock:
+            self._pending_weights = weights
+
+
+class QValueCache:
+
+    def __init__(self, max_size: int, log_every: int = 5000):
+        """
+        - Bounded LRU map from observation bytes to the network's Q values
+        - Keys are 16 byte blake2b digests of the stacked input frames, so a lookup costs
+          one hash instead of a forward pass
+        - Must be cleared whenever the weights change (QLearningAgent.weights_updated)
+        :param max_size: most cached observations, least recently used ones are evicted
+        :param log_every: log the hit rate every n lookups
+        """
+        self.max_size = max_size
+        self.log_every = log_every
+        self.hits = 0
+        self.misses = 0
+        self._cache: OrderedDict[bytes, np.ndarray] = OrderedDict()
+
+    def __len__(self):
+        return len(self._cache)
+
+    @staticmethod
+    def key(inputs: np.ndarray) -> bytes:
+        return hashlib.blake2b(inputs.tobytes(), digest_size=16).digest()
+
+    def get(self, key):
+        q_values = self._cache.get(key)
+        if q_values is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._cache.move_to_end(key)
+        if (self.hits + self.misses) % self.log_every == 0:
+            log.info(
+                f"Q value cache: {self.hit_rate():.1%} hit rate over "
+                f"{self.hits + self.misses} lookups, {len(self._cache)} entries."
+            )
+        return q_values
+
+    def put(self, key, q_values):
+        self._cache[key] = q_values
+        if len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+    def clear(self):
+        self._cache.clear()
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
 
 
 class QLearningParams:
@@ -87,8 +548,20 @@ class QLearningAgent(Agent):
         training_model: bool = True,
         model_path: str | None = None,
         train_each_step: bool = False,
+        train_every: int | None = None,
         debug: bool = False,
         timeout: bool = True,
+        prioritized_replay: bool = False,
+        priority_alpha: float = 0.6,
+        priority_beta: float = 0.4,
+        action_repeat: int = 1,
+        n_step: int = 1,
+        async_training: bool = False,
+        replay_ratio: float = 1.0,
+        sync_every: int = 10,
+        remote_learner: bool = False,
+        symmetry_augmentation: bool = False,
+        q_cache_size: int | None = None,
     ):
         # initialize Agent parent class
         # add one to num_inputs for current speed
@@ -101,24 +574,48 @@ class QLearningAgent(Agent):
         self.y = y
         self.epsilon = epsilon
         self.batch_size = batch_size
+        # query the network every action_repeat steps, folding rewards in between
+        self.action_repeat = action_repeat
+        # train on every rotation/reflection of each sampled transition
+        self.symmetry_augmentation = symmetry_augmentation
+        # Q values of recently seen observations, cleared on every weight change
+        self.q_cache = QValueCache(q_cache_size) if q_cache_size else None
         # Q learning replay memory
-        self.replay_memory = ReplayMemory(max_size=replay_mem_max)
+        if prioritized_replay:
+            self.replay_memory = PrioritizedReplayMemory(
+                max_size=replay_mem_max, alpha=priority_alpha, beta=priority_beta
+            )
+        else:
+            self.replay_memory = ReplayMemory(max_size=replay_mem_max)
+        self._n_step = NStepAccumulator(n=n_step, y=y)
         # private state
         self._last_reward_time = time.time()
         self._current_state = None
         self._current_action = None
         self._rewarded_currently = False
         self._collision_count = 0
+        self._repeat_count = 0
+        self._repeat_reward = 0
+        # duration of the most recent _train_model call in seconds
+        self.last_train_time: float | None = None
+        # number of completed _train_model calls
+        self.updates = 0
+        self._step_count = 0
         # load/save/training properties
         self._save_after = save_after
         self._load_latest_model = load_latest_model
         self._training_model = training_model  # boolean
         self._model_path = model_path
-        self._train_each_step = train_each_step
+        # train every n steps on top of the end of each episode, 1 = train_each_step
+        self._train_every = 1 if train_each_step else train_every
+        # experiences are shipped to a learner process (see distributed.TransitionOutbox)
+        self._remote_learner = remote_learner
         self._timeout = timeout
         self._steps_without_reward = 0
         # debug private attributes
         self._debug = debug
+        # the network was loaded whole from a .keras file (e.g. a distilled student)
+        self._full_model = False
         # build Sequential tensorflow model
         self._model = Sequential()
         self._model.add(InputLayer(input_shape=(*input_shape, 1)))
@@ -127,15 +624,22 @@ class QLearningAgent(Agent):
         self._model.add(Flatten())
         self._model.add(Dense(256, activation="relu"))
         self._model.add(Dense(self.num_outputs, activation="linear"))
-        self._model.compile(
-            loss="mse", optimizer=Adam(learning_rate=self.alpha, decay=alpha_decay)
-        )
+        self._compile_model(self._model)
         if self._debug:
             self._model.summary()
         if self._model_path is not None:
             self.load_model(self._model_path)
         elif self._load_latest_model:
             self.init_default_model_weights()
+        # background training (training_model only)
+        self._learner = None
+        # set by close, a closed agent only acts
+        self._closed = False
+        if async_training and self._training_model:
+            self._learner = AsyncLearner(
+                self, replay_ratio=replay_ratio, sync_every=sync_every
+            )
+            self._learner.start()
         # Q learning rewards
         self._qlearn_params = QLearningParams(
             wall_collision_value=-20,
@@ -160,13 +664,22 @@ class QLearningAgent(Agent):
         assert (
             self._simulator is not None
         ), "Simulator must be set using .set_simulator()"
+        if self._learner is not None:
+            self._learner.notify_step()
         reward = self._get_reward(reward_collision, wall_collision)
         # Change internal states
         self._handle_collision(wall_collision)
         reward, restart = self._handle_reward(reward, reward_collision)
-        self._handle_experience(reward, inputs)
+        episode_end = wall_collision or restart
+        if self._handle_repeat(reward, reward_collision or episode_end):
+            return self._current_action
+        reward = self._repeat_reward
+        self._repeat_reward = 0
+        self._repeat_count = 0
+        self._handle_experience(reward, inputs, episode_end)
         self._handle_training()
-        actions = self._model.predict(inputs, verbose=0)
+        self._sync_weights()
+        actions = self._predict(inputs)
         action = np.argmax(actions)
         if np.random.rand() > self.epsilon and self._training_model:
             action = np.random.choice(np.arange(self.num_outputs))
@@ -178,6 +691,27 @@ class QLearningAgent(Agent):
             self._request_restart()
         return action
 
+    def _predict(self, inputs):
+        """
+        - Q values of one observation, predict_on_batch skips the per call data pipeline
+          setup of predict, which costs far more than the network itself
+        """
+        if self.q_cache is None:
+            return self._model.predict_on_batch(inputs)
+        key = self.q_cache.key(inputs)
+        q_values = self.q_cache.get(key)
+        if q_values is None:
+            q_values = self._model.predict_on_batch(inputs)
+            self.q_cache.put(key, q_values)
+        return q_values
+
+    def weights_updated(self):
+        """
+        - Call whenever the acting network's weights change
+        """
+        if self.q_cache is not None:
+            self.q_cache.clear()
+
     def _get_reward(self, reward_collision, wall_collision):
         if wall_collision:
             return self._qlearn_params.wall
@@ -186,31 +720,66 @@ class QLearningAgent(Agent):
         else:
             return self._qlearn_params.other
 
-    def _handle_experience(self, reward, inputs):
+    def _handle_repeat(self, reward, event):
+        """
+        - Accumulate reward while the last action is being repeated
+        :param event: collisions always force a new decision
+        :return: whether the last action should be repeated without querying the network
+        """
+        self._repeat_reward += reward
+        self._repeat_count += 1
+        return (
+            self._current_action is not None
+            and self._repeat_count < self.action_repeat
+            and not event
+        )
+
+    def _handle_experience(self, reward, inputs, episode_end=False):
         if self._current_state is not None:
-            self.replay_memory.add_experience(
-                Experience(
-                    current_state=self._current_state,
-                    current_action=self._current_action,
-                    resulting_reward=reward,
-                    resulting_state=inputs,
-                )
+            experiences = self._n_step.add(
+                self._current_state, self._current_action, reward, inputs
             )
+            if episode_end:
+                experiences += self._n_step.flush(inputs)
+            for experience in experiences:
+                self.replay_memory.add_experience(experience)
         self._current_state = inputs
 
+    def _trains_inline(self):
+        return (
+            self._training_model
+            and self._learner is None
+            and not self._remote_learner
+            and not self._closed
+        )
+
     def _handle_training(self):
-        if self._training_model:
-            if self._train_each_step:
+        if self._trains_inline():
+            self._step_count += 1
+            if self._train_every and self._step_count % self._train_every == 0:
                 self._train_model()
 
     def _handle_collision(self, wall_collision):
+        if self._closed:
+            return
         if wall_collision:
-            if self._collision_count % self._save_after == 0:
+            if self._save_after and self._collision_count % self._save_after == 0:
                 self._save_model_increment()
-            if self._training_model:
+            if self._trains_inline():
                 self._train_model()
             self._collision_count += 1
 
+    def _sync_weights(self):
+        """
+        - Copy weights published by the async learner into the acting network
+        """
+        if self._learner is None:
+            return
+        weights = self._learner.pull_weights()
+        if weights is not None:
+            self._model.set_weights(weights)
+            self.weights_updated()
+
     def _handle_reward(self, reward, reward_collision):
         restart = False
         if reward_collision:
@@ -238,37 +807,187 @@ class QLearningAgent(Agent):
         self._simulator.reset()
         self._steps_without_reward = 0
 
-    def _train_model(self):
+    def _compile_model(self, model):
+        model.compile(
+            loss="mse",
+            optimizer=Adam(learning_rate=self.alpha, decay=self.alpha_decay),
+        )
+
+    def _train_model(self, model=None, rng=None):
         """
         - Get [self.batch_size] number of experiences and train on those experiences
+        - Q values for the whole batch come from two batched predict calls
+        :param model: network to train, defaults to the acting network
+        :param rng: RandomState to sample the replay memory with
         """
-        batch = self.replay_memory.get_random_experiences(self.batch_size)
-        X_train = np.zeros((self.batch_size, *self.input_shape, 1))
-        y_train = np.zeros((self.batch_size, self.num_outputs))
-        for i, experience in enumerate(batch):
-            current_state = np.array(experience.current_state)
-            # predict the q_values
-            q_value_prediction = self._model.predict(current_state, verbose=0)
-            # set the target to be what the experience actually was
-            q_target = experience.res_reward
-            resulting_state = np.array(experience.next_state)
-            q_target = q_target + self.y * np.max(
-                self._model.predict(resulting_state, verbose=0)[0]
+        model = self._model if model is None else model
+        start = time.perf_counter()
+        batch, indices, weights = self.replay_memory.sample(self.batch_size, rng)
+        if not batch:
+            return
+        states = np.concatenate([e.current_state for e in batch])
+        next_states = np.concatenate([e.next_state for e in batch])
+        actions = np.array([e.current_action for e in batch], dtype=np.int64)
+        rewards = np.array([e.res_reward for e in batch], dtype=np.float64)
+        n_steps = np.array([e.n_steps for e in batch])
+        copies = 1
+        if self.symmetry_augmentation:
+            states, actions, next_states, copies = augment_batch(
+                states, actions, next_states, frames=VIDEO_FRAMES
             )
-            # adjust the weights (no other q_vals are impacted)
-            q_value_prediction[0][experience.current_action] = q_target
-            X_train[i] = current_state
-            y_train[i] = q_value_prediction[0]
+            rewards = np.tile(rewards, copies)
+            n_steps = np.tile(n_steps, copies)
+            if weights is not None:
+                weights = np.tile(weights, copies)
+        rows = np.arange(len(states))
+        q_values = model.predict(states, verbose=0, batch_size=len(states))
+        q_next = model.predict(next_states, verbose=0, batch_size=len(states))
+        # set the target to be what the experience actually was
+        q_targets = rewards + self.y**n_steps * np.max(q_next, axis=1)
+        td_errors = q_targets - q_values[rows, actions]
+        # adjust the weights (no other q_vals are impacted)
+        q_values[rows, actions] = q_targets
 
-        self._model.fit(
-            X_train, y_train, verbose=0, epochs=3, batch_size=self.batch_size
+        # the batch is already a random sample, and Keras' own shuffling draws from an
+        # unseeded RNG that snapshots cannot restore
+        model.fit(
+            states,
+            q_values,
+            sample_weight=weights,
+            verbose=0,
+            epochs=3,
+            batch_size=self.batch_size,
+            shuffle=False,
         )
+        # priorities belong to the sampled transitions, not their symmetric copies
+        self.replay_memory.update_priorities(indices, td_errors[: len(batch)])
+        if model is self._model:
+            self.weights_updated()
+        self.updates += 1
+        self.last_train_time = time.perf_counter() - start
+
+    def get_training_state(self):
+        """
+        - Everything needed to resume training exactly: weights, optimizer slots, replay
+          contents, exploration and bookkeeping counters
+        - With an async learner the learner's network, optimizer, counters and RNG are
+          the ones saved, captured while it is paused
+        :return: (arrays, meta)
+        """
+        learner = self._learner
+        with nullcontext() if learner is None else learner.paused():
+            self._sync_weights()
+            trainer = self._model if learner is None else learner._model
+            arrays = {}
+            for i, weight in enumerate(trainer.get_weights()):
+                arrays[f"w{i}"] = weight
+            for i, variable in enumerate(trainer.optimizer.variables):
+                arrays[f"opt{i}"] = np.array(variable.numpy())
+            replay_arrays, replay_meta = self.replay_memory.get_state()
+            for key, value in replay_arrays.items():
+                arrays[f"replay.{key}"] = value
+            for key, value in self._n_step.get_state().items():
+                arrays[f"nstep.{key}"] = value
+            if self._current_state is not None:
+                arrays["current_state"] = self._current_state
+            meta = {
+                "epsilon": self.epsilon,
+                "collision_count": self._collision_count,
+                "steps_without_reward": self._steps_without_reward,
+                "rewarded_currently": self._rewarded_currently,
+                "current_action": (
+                    None if self._current_action is None else int(self._current_action)
+                ),
+                "repeat_count": self._repeat_count,
+                "repeat_reward": float(self._repeat_reward),
+                "step_count": self._step_count,
+                "updates": self.updates,
+                "optimizer_built": trainer.optimizer.built,
+                "replay": replay_meta,
+            }
+            if learner is not None:
+                learner_arrays, meta["learner"] = learner.get_state()
+                for key, value in learner_arrays.items():
+                    arrays[f"learner.{key}"] = value
+        return arrays, meta
+
+    def set_training_state(self, arrays, meta):
+        learner = self._learner
+        with nullcontext() if learner is None else learner.paused():
+            weights = [arrays[f"w{i}"] for i in range(len(self._model.get_weights()))]
+            self._model.set_weights(weights)
+            self.weights_updated()
+            trainer = self._model
+            if learner is not None:
+                learner._model.set_weights(weights)
+                trainer = learner._model
+            if meta["optimizer_built"]:
+                optimizer = trainer.optimizer
+                if not optimizer.built:
+                    optimizer.build(trainer.trainable_variables)
+                for i, variable in enumerate(optimizer.variables):
+                    variable.assign(arrays[f"opt{i}"])
+            self.replay_memory.set_state(
+                {
+                    key[len("replay.") :]: value
+                    for key, value in arrays.items()
+                    if key.startswith("replay.")
+                },
+                meta["replay"],
+            )
+            self._n_step.set_state(
+                {
+                    key[len("nstep.") :]: value
+                    for key, value in arrays.items()
+                    if key.startswith("nstep.")
+                }
+            )
+            self._current_state = arrays.get("current_state")
+            self._current_action = meta["current_action"]
+            self.epsilon = meta["epsilon"]
+            self._collision_count = meta["collision_count"]
+            self._steps_without_reward = meta["steps_without_reward"]
+            self._rewarded_currently = meta["rewarded_currently"]
+            self._repeat_count = meta["repeat_count"]
+            self._repeat_reward = meta["repeat_reward"]
+            self._step_count = meta.get("step_count", 0)
+            self.updates = meta.get("updates", 0)
+            if learner is not None and "learner" in meta:
+                learner.set_state(
+                    {
+                        key[len("learner.") :]: value
+                        for key, value in arrays.items()
+                        if key.startswith("learner.")
+                    },
+                    meta["learner"],
+                )
+
+    def close(self):
+        """
+        - Stop the async learner and keep its final weights, flush any outgoing experiences
+        - The agent keeps acting afterwards but no longer trains or saves
+        """
+        self._closed = True
+        if self._learner is not None:
+            self._learner.stop()
+            self._sync_weights()
+            log.info(f"Async learner stopped after {self._learner.updates} updates.")
+            self._learner = None
+        if self.q_cache is not None:
+            log.info(
+                f"Q value cache: {self.q_cache.hit_rate():.1%} hit rate over "
+                f"{self.q_cache.hits + self.q_cache.misses} lookups."
+            )
+        self.replay_memory.close()
 
     def _save_model_increment(self):
         """
         Save the current model to a unique location representing the current iteration
         :return: None
         """
+        if self._remote_learner:
+            # the learner owns the weights
+            return
         self._model.save_weights(
             "./src/assets/models/model_" + str(self._collision_count) + ".weights.h5"
         )
@@ -279,19 +998,40 @@ class QLearningAgent(Agent):
         :param path: the path to the model
         :return: None
         """
-        self._model.save_weights(os.path.join("src", "assets", "models", path))
+        if self._remote_learner:
+            return
+        path = os.path.join("src", "assets", "models", path)
+        if self._full_model or path.endswith(".keras"):
+            # a loaded network's weights would not fit the default one, keep it whole
+            path = path.removesuffix(".weights.h5").removesuffix(".keras") + ".keras"
+            self._model.save(path)
+        else:
+            self._model.save_weights(path)
 
     def init_default_model_weights(self):
         self._model.load_weights(
             os.path.join("src", "assets", "models", "latest.weights.h5")
         )
+        self.weights_updated()
 
     def load_model(self, path: str):
         """
         - Load the brain of the agent from some file (or don't)
+        - A .keras file replaces the whole network, e.g. a student from distill.py,
+          anything else is loaded as weights of the default network
         :param path: the path to the model
         :return: None
         """
-        self._model.load_weights(
-            os.path.join("src", "assets", "models", path)
-        )
+        path = os.path.join("src", "assets", "models", path)
+        if path.endswith(".keras"):
+            model = load_keras_model(path, compile=False)
+            assert model.input_shape[1:] == (
+                *self.input_shape,
+                1,
+            ), f"{path} expects inputs of shape {model.input_shape[1:]}."
+            self._compile_model(model)
+            self._model = model
+            self._full_model = True
+        else:
+            self._model.load_weights(path)
+        self.weights_updated()
@@ -0,0 +1,219 @@
+from constants import FOOD_COLOR, SNAKE_COLOR
+import numpy as np
+import os
+import logging
+
+log = logging.getLogger(__name__)
+
+# same colors as gui.components.Board
+PALETTE = np.array(
+    [
+        (255, 255, 255),  # empty
+        (0, 255, 0),  # snake
+        (255, 0, 0),  # food
+        (0, 0, 0),  # cell border
+    ],
+    dtype=np.uint8,
+)
+EMPTY_INDEX = 0
+SNAKE_INDEX = 1
+FOOD_INDEX = 2
+BORDER_INDEX = 3
+
+
+def board_to_indices(board):
+    """
+    - Map a SimulatorModel board (width, height, 1) to palette indices (width, height)
+    """
+    cells = board[..., 0]
+    return (
+        (cells == SNAKE_COLOR) * SNAKE_INDEX + (cells == FOOD_COLOR) * FOOD_INDEX
+    ).astype(np.uint8)
+
+
+def downsample_indices(board, factor):
+    """
+    - Palette indices of a board shrunk by an integer factor, e.g. for a minimap
+    - A block shows food if it holds any food, else snake if it holds any snake
+    :return: (ceil(width / factor), ceil(height / factor)) array, indexed [x, y]
+    """
+    cells = board[..., 0]
+    width, height = cells.shape
+    blocks = (-(-width // factor), -(-height // factor))
+    padded = np.zeros((blocks[0] * factor, blocks[1] * factor), dtype=cells.dtype)
+    padded[:width, :height] = cells
+    padded = padded.reshape(blocks[0], factor, blocks[1], factor)
+    snake = (padded == SNAKE_COLOR).any(axis=(1, 3))
+    food = (padded == FOOD_COLOR).any(axis=(1, 3))
+    return np.where(food, FOOD_INDEX, snake * SNAKE_INDEX).astype(np.uint8)
+
+
+def render_indices(board, cell_size, borders=True):
+    """
+    - Rasterize a board into a (height * cell_size, width * cell_size) image of palette indices
+    - Board is indexed [x, y] while images are indexed [row, column], hence the transpose
+    :param board: SimulatorModel board
+    :param cell_size: pixels per cell
+    :param borders: draw a one pixel border around each cell like the GUI does
+    """
+    indices = board_to_indices(board).T
+    frame = np.repeat(np.repeat(indices, cell_size, axis=0), cell_size, axis=1)
+    if borders and cell_size >= 3:
+        frame[::cell_size, :] = BORDER_INDEX
+        frame[:, ::cell_size] = BORDER_INDEX
+    return frame
+
+
+def render_frame(board, cell_size, borders=True):
+    """
+    - RGB version of render_indices, shape (height_px, width_px, 3)
+    """
+    return PALETTE[render_indices(board, cell_size, borders=borders)]
+
+
+class GifWriter:
+    """
+    - Streams frames of palette indices into an animated GIF one frame at a time
+    - Pixel data uses the "uncompressed" LZW layout: a clear code before every pair of
+      pixels keeps the code width fixed at 3 bits, so a frame is encoded with a handful
+      of vectorized numpy calls instead of a per-pixel dictionary walk
+    """
+
+    _MIN_CODE_SIZE = 2  # 4 color palette
+    _CLEAR_CODE = 4
+    _END_CODE = 5
+    _CODE_WIDTH = 3
+
+    def __init__(self, path, width, height, fps=10, loop=True):
+        self.path = path
+        self.width = width
+        self.height = height
+        self.delay = max(1, round(100 / fps))  # hundredths of a second
+        self.frames = 0
+        self._file = open(path, "wb")
+        self._write_header(loop)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _write_header(self, loop):
+        f = self._file
+        f.write(b"GIF89a")
+        # logical screen: global color table present, 2 bits per color
+        f.write(np.array([self.width, self.height], dtype="<u2").tobytes())
+        f.write(bytes([0b10010001, 0, 0]))
+        f.write(PALETTE.tobytes())
+        if loop:
+            # NETSCAPE2.0 application extension, repeat forever
+            f.write(b"\x21\xff\x0bNETSCAPE2.0\x03\x01\x00\x00\x00")
+
+    def write(self, frame):
+        """
+        :param frame: (height, width) array of palette indices
+        """
+        assert frame.shape == (self.height, self.width), "Frame size mismatch"
+        f = self._file
+        # graphic control extension (frame delay)
+        f.write(b"\x21\xf9\x04\x00")
+        f.write(np.array([self.delay], dtype="<u2").tobytes())
+        f.write(b"\x00\x00")
+        # image descriptor covering the whole screen
+        f.write(b"\x2c\x00\x00\x00\x00")
+        f.write(np.array([self.width, self.height], dtype="<u2").tobytes())
+        f.write(b"\x00")
+        f.write(bytes([self._MIN_CODE_SIZE]))
+        data = self._encode(frame.ravel())
+        for start in range(0, len(data), 255):
+            block = data[start : start + 255]
+            f.write(bytes([len(block)]))
+            f.write(block)
+        f.write(b"\x00")
+        self.frames += 1
+
+    def _encode(self, pixels):
+        if len(pixels) % 2:
+            pixels = np.append(pixels, pixels[-1:])
+        # [clear, p0, p1, clear, p2, p3, ..., end]
+        codes = np.empty((len(pixels) // 2, 3), dtype=np.uint8)
+        codes[:, 0] = self._CLEAR_CODE
+        codes[:, 1:] = pixels.reshape(-1, 2)
+        codes = np.append(codes.ravel(), self._END_CODE)
+        bits = (codes[:, None] >> np.arange(self._CODE_WIDTH, dtype=np.uint8)) & 1
+        return np.packbits(bits.ravel(), bitorder="little").tobytes()
+
+    def close(self):
+        if not self._file.closed:
+            self._file.write(b"\x3b")
+            self._file.close()
+
+
+class RawFrameWriter:
+    """
+    - Streams frames as headerless rgb24, e.g. for
+      ffmpeg -f rawvideo -pix_fmt rgb24 -s WIDTHxHEIGHT -r FPS -i episode.rgb out.mp4
+    """
+
+    def __init__(self, path, width, height, fps=10):
+        self.path = path
+        self.width = width
+        self.height = height
+        self.frames = 0
+        self._file = open(path, "wb")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, frame):
+        """
+        :param frame: (height, width) array of palette indices
+        """
+        assert frame.shape == (self.height, self.width), "Frame size mismatch"
+        self._file.write(PALETTE[frame].tobytes())
+        self.frames += 1
+
+    def close(self):
+        self._file.close()
+
+
+WRITERS = {"gif": GifWriter, "rgb": RawFrameWriter}
+
+
+def export_episodes(model, num_episodes, directory, cell_size=8, fmt="gif", fps=10):
+    """
+    - Run a SimulatorModel headless and write every episode to its own file
+    - Frames are rendered from model.board and written immediately, so memory use does
+      not grow with episode length
+    :param model: SimulatorModel with its agent set
+    :param num_episodes: number of episodes to export
+    :param directory: output directory
+    :param cell_size: pixels per cell
+    :param fmt: 'gif' or 'rgb'
+    :param fps: playback speed
+    :return: list of written paths
+    """
+    writer_class = WRITERS[fmt]
+    os.makedirs(directory, exist_ok=True)
+    width = model.width * cell_size
+    height = model.height * cell_size
+    paths = []
+    done = False
+    while len(paths) < num_episodes and not done:
+        episode = model.iteration_num
+        path = os.path.join(directory, f"episode_{episode}.{fmt}")
+        with writer_class(path, width, height, fps=fps) as writer:
+            writer.write(render_indices(model.board, cell_size))
+            while not done:
+                done = model.update_state(keys_pressed=None)
+                if model.iteration_num != episode:
+                    # the board has already been reset for the next episode
+                    break
+                writer.write(render_indices(model.board, cell_size))
+        log.info(f"Exported episode {episode} ({writer.frames} frames) to {path}")
+        paths.append(path)
+    return paths
@@ -0,0 +1,222 @@
+from agent import Agent
+from multiprocessing import shared_memory
+import multiprocessing
+import numpy as np
+import weakref
+import logging
+
+log = logging.getLogger(__name__)
+
+# messages to the agent process, replies are (step, action, reset_requested) for STEP
+# and None for everything else
+ATTACH = 1  # (ATTACH, shared memory name, observation shape, slots)
+STEP = 2  # (STEP, step, slot, reward_collision, wall_collision)
+SAVE = 3  # (SAVE, path)
+LOAD = 4  # (LOAD, path)
+CLOSE = 5  # (CLOSE,)
+SHUTDOWN = 6  # (SHUTDOWN,)
+
+
+class _SimulatorProxy:
+    """
+    - Stands in for the SimulatorModel inside the agent process
+    - Only reset() is supported: the request is sent back with the action and carried
+      out by the simulator process
+    """
+
+    def __init__(self):
+        self.reset_requested = False
+
+    def reset(self):
+        self.reset_requested = True
+
+    def pop_reset(self):
+        requested, self.reset_requested = self.reset_requested, False
+        return requested
+
+
+def _serve_agent(agent_factory, args, kwargs, conn):
+    """
+    - Agent process main loop: build the agent, then answer messages until SHUTDOWN
+    """
+    agent = agent_factory(*args, **kwargs)
+    simulator = _SimulatorProxy()
+    agent.set_simulator(simulator)
+    shm = None
+    ring = None
+    try:
+        while True:
+            message = conn.recv()
+            kind = message[0]
+            if kind == STEP:
+                _, step, slot, reward_collision, wall_collision = message
+                # the agent sees the same float board an in-process agent gets
+                inputs = ring[slot].astype(np.float64)
+                action = agent.update(inputs, reward_collision, wall_collision, None)
+                conn.send((step, int(action), simulator.pop_reset()))
+                continue
+            if kind == ATTACH:
+                _, name, shape, slots = message
+                shm = shared_memory.SharedMemory(name=name)
+                ring = np.ndarray((slots, *shape), dtype=np.int8, buffer=shm.buf)
+            elif kind == SAVE:
+                agent.save_model(message[1])
+            elif kind == LOAD:
+                agent.load_model(message[1])
+            elif kind == CLOSE:
+                agent.close()
+            elif kind == SHUTDOWN:
+                conn.send(None)
+                break
+            conn.send(None)
+    except (EOFError, KeyboardInterrupt):
+        # the simulator process went away
+        pass
+    finally:
+        ring = None
+        if shm is not None:
+            shm.close()
+        conn.close()
+
+
+def _shutdown(process, conn, shm):
+    try:
+        conn.send((SHUTDOWN,))
+        conn.recv()
+    except (EOFError, OSError):
+        pass
+    process.join(timeout=5)
+    if process.is_alive():
+        process.terminate()
+    conn.close()
+    if shm is not None:
+        try:
+            shm.close()
+        except BufferError:
+            # the ring buffer view is still alive when this runs at interpreter exit
+            pass
+        shm.unlink()
+
+
+class RemoteAgent(Agent):
+
+    def __init__(
+        self,
+        input_shape: tuple[int, int],
+        num_outputs: int,
+        agent_factory,
+        args=(),
+        kwargs=None,
+        slots: int = 4,
+        blocking: bool = True,
+    ):
+        """
+        - Runs another Agent in its own process: observations are written into a shared
+          memory ring buffer of int8 boards, and only small (step, slot, flags) and
+          (step, action) tuples go over a pipe
+        - Blocking mode waits for the action of every step, so the game plays exactly as
+          with the agent in process
+        - Non-blocking mode never waits unless the agent is a whole ring buffer behind:
+          each step returns the latest action received (4 = keep going until the first
+          one arrives), so a slow agent cannot stall rendering
+        - The agent gets None for keys_pressed, and its simulator only supports reset()
+        :param agent_factory: picklable callable building the agent (e.g. the class)
+        :param args: positional arguments for agent_factory
+        :param kwargs: keyword arguments for agent_factory
+        :param slots: observations in the ring buffer
+        :param blocking: wait for the action of every step
+        """
+        super().__init__(input_shape, num_outputs, training=False)
+        self.slots = slots
+        self.blocking = blocking
+        self._step = 0
+        self._pending = 0
+        self._action = 4
+        self._ring = None
+        self._shm = None
+        context = multiprocessing.get_context("spawn")
+        self._conn, child_conn = context.Pipe()
+        self._process = context.Process(
+            target=_serve_agent,
+            args=(agent_factory, args, kwargs or {}, child_conn),
+            daemon=True,
+        )
+        self._process.start()
+        child_conn.close()
+        self._finalizer = weakref.finalize(
+            self, _shutdown, self._process, self._conn, None
+        )
+        log.info(f"Started agent process {self._process.pid}")
+
+    def update(
+        self, inputs, reward_collision=False, wall_collision=False, keys_pressed=None
+    ):
+        if self._ring is None:
+            self._attach(inputs.shape)
+        # never overwrite an observation the agent has not read yet
+        while self._pending >= self.slots:
+            self._receive()
+        slot = self._step % self.slots
+        self._ring[slot] = inputs
+        self._conn.send(
+            (STEP, self._step, slot, bool(reward_collision), bool(wall_collision))
+        )
+        self._step += 1
+        self._pending += 1
+        if self.blocking:
+            while self._pending:
+                self._receive()
+        else:
+            while self._pending and self._conn.poll():
+                self._receive()
+        return self._action
+
+    def _attach(self, shape):
+        self._shm = shared_memory.SharedMemory(
+            create=True, size=self.slots * int(np.prod(shape))
+        )
+        self._ring = np.ndarray(
+            (self.slots, *shape), dtype=np.int8, buffer=self._shm.buf
+        )
+        # clean up the segment together with the process
+        self._finalizer.detach()
+        self._finalizer = weakref.finalize(
+            self, _shutdown, self._process, self._conn, self._shm
+        )
+        self._request((ATTACH, self._shm.name, tuple(shape), self.slots))
+
+    def _receive(self):
+        step, action, reset_requested = self._conn.recv()
+        self._pending -= 1
+        self._action = action
+        if reset_requested:
+            self._simulator.reset()
+
+    def _request(self, message):
+        """
+        - Send a command once every outstanding step has been answered
+        """
+        while self._pending:
+            self._receive()
+        self._conn.send(message)
+        self._conn.recv()
+
+    def save_model(self, path):
+        self._request((SAVE, path))
+
+    def load_model(self, path):
+        self._request((LOAD, path))
+
+    def close(self):
+        """
+        - Close the remote agent, the process keeps running for a final save_model
+        """
+        if self._process.is_alive():
+            self._request((CLOSE,))
+
+    def shutdown(self):
+        """
+        - Stop the agent process and free the shared memory (also done at exit)
+        """
+        self._ring = None
+        self._finalizer()
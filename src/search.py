@@ -0,0 +1,103 @@
+from agent import Agent
+from gamestate import GameState
+import numpy as np
+import time
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class SearchAgent(Agent):
+
+    def __init__(
+        self,
+        input_shape: tuple[int, int],
+        num_outputs: int,
+        depth: int = 4,
+        discount: float = 0.9,
+        food_value: float = 1.0,
+        death_value: float = -10.0,
+        seed: int | None = None,
+    ):
+        """
+        - Reference lookahead agent: exhaustive depth limited search over GameState
+          using apply/undo, so no node ever copies the board
+        - Leaves are scored by their closeness to the food, so the snake keeps heading
+          towards food that is beyond the search horizon
+        - Food eaten inside the search is respawned with the agent's own RandomState, the
+          simulation's random number stream is never touched
+        :param depth: number of moves looked ahead
+        :param discount: weight of each further move
+        :param food_value: value of eating
+        :param death_value: value of hitting a wall or the snake
+        :param seed: seed of the RandomState used inside the search
+        """
+        super().__init__(input_shape, num_outputs, training=False)
+        self.depth = depth
+        self.discount = discount
+        self.food_value = food_value
+        self.death_value = death_value
+        self.rng = np.random.RandomState(seed)
+        # stats
+        self.decisions = 0
+        self.nodes = 0
+        self.search_time = 0.0
+
+    def update(
+        self, inputs, reward_collision=False, wall_collision=False, keys_pressed=None
+    ):
+        if wall_collision:
+            # the episode is over, nothing to plan
+            return 4
+        start = time.perf_counter()
+        state = GameState.from_model(self._simulator, rng=self.rng)
+        best_action, best_value = 4, -np.inf
+        for action in range(self.num_outputs):
+            value = self._evaluate(state, action, self.depth)
+            if value > best_value:
+                best_action, best_value = action, value
+        self.decisions += 1
+        self.search_time += time.perf_counter() - start
+        return best_action
+
+    def _evaluate(self, state, action, depth):
+        state.apply(action)
+        self.nodes += 1
+        food, wall_hit, snake_hit = state.status()
+        if wall_hit or snake_hit:
+            value = self.death_value
+        elif depth <= 1:
+            value = self.food_value if food else self._closeness(state)
+        else:
+            value = food * self.food_value + self.discount * max(
+                self._evaluate(state, a, depth - 1) for a in range(self.num_outputs)
+            )
+        state.undo()
+        return value
+
+    def _closeness(self, state):
+        """
+        - Manhattan closeness of the head to the food, at most half of food_value so that
+          eating sooner always beats ending the search next to the food
+        """
+        (x, y), (fx, fy) = state.head, state.food
+        distance = (abs(x - fx) + abs(y - fy)) / (state.width + state.height)
+        return 0.5 * self.food_value * (1 - distance)
+
+    def nodes_per_second(self):
+        return self.nodes / self.search_time if self.search_time else 0.0
+
+    def close(self):
+        if self.decisions:
+            log.info(
+                f"Search: {self.decisions} decisions, "
+                f"{self.nodes / self.decisions:.0f} nodes per decision, "
+                f"{self.nodes_per_second():.0f} nodes/s, "
+                f"{1000 * self.search_time / self.decisions:.2f} ms per decision."
+            )
+
+    def save_model(self, path):
+        pass
+
+    def load_model(self, path):
+        pass
@@ -1,7 +1,9 @@
 from constants import FOOD_COLOR, SNAKE_COLOR
-from gui.components import Board
+from gui.components import Board, Hud, Viewport
+from controls import InputQueue
 from utils import calculate_fps
 from snake import Snake
+from snapshot import save_snapshot
 from time import time
 import numpy as np
 import pygame
@@ -13,19 +15,54 @@ log = logging.getLogger(__name__)
 
 class Simulator:
 
-    def __init__(self, width, height, model, fps=2, caption="AI Snake Simulator"):
+    def __init__(
+        self,
+        width,
+        height,
+        model,
+        fps=2,
+        caption="AI Snake Simulator",
+        hud=True,
+        input_poll_rate=None,
+        viewport=False,
+    ):
+        """
+        :param fps: simulation steps per second
+        :param input_poll_rate: events are polled this many times per second (None = once
+                                per step), the simulation still steps at fps
+        :param viewport: draw through a zoomable Viewport that follows the snake, always
+                         used when the board has more cells than the window has pixels
+        """
         pygame.init()
         self.model = model
         self.window = pygame.display.set_mode((width, height))
         self.caption = caption
         self.fps = fps
+        self.input_poll_rate = input_poll_rate
         self.clock = pygame.time.Clock()
-        self.board = Board(
-            self.window, width, height, self.model.width, self.model.height
-        )
+        # keyboard turns, consumed by agents given it via set_input_queue
+        self.input_queue = InputQueue()
+        self._next_step = None
+        self.viewport = None
+        if viewport or max(self.model.width, self.model.height) > min(width, height):
+            self.viewport = Viewport(
+                self.window, width, height, self.model.width, self.model.height
+            )
+            self.board = self.viewport
+        else:
+            self.board = Board(
+                self.window, width, height, self.model.width, self.model.height
+            )
 
         self.calc_fps = 0
         self.current_timestamp = None
+        # performance overlay, rates are averaged over one second windows
+        self.hud = Hud() if hud else None
+        self.steps_per_second = 0
+        self.render_fps = 0
+        self._window_start = time()
+        self._window_steps = 0
+        self._window_frames = 0
 
     def start(self):
         """
@@ -36,28 +73,86 @@ class Simulator:
         run = True
         pygame.display.set_caption(self.caption)
         # - - - - - - - - - - - - - - - - - - - - - - - - - -
+        tick_rate = self.fps if self.input_poll_rate is None else self.input_poll_rate
         while run:
-            if self.fps is not None and run:
-                self.clock.tick(self.fps)
+            if tick_rate is not None and run:
+                self.clock.tick(tick_rate)
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     run = False
                     if self.model is not None:
                         self.model.handle_close_event()
                     break
+                self.input_queue.handle_event(event)
+                if self.viewport is not None:
+                    self.viewport.handle_event(event)
+            if run and not self.step_due():
+                continue
             t = self.current_timestamp
             self.current_timestamp = time()
             if t is not None:
                 self.calc_fps = calculate_fps(self.current_timestamp - t)
             keys_pressed = pygame.key.get_pressed()
             run = self.model.update_state(keys_pressed) or run
+            self._window_steps += 1
             self.model.print_current_state()
             self.update_display()
 
+    def step_due(self):
+        """
+        - Whether the simulation should step on this tick, when polling faster than fps
+        """
+        if self.input_poll_rate is None or self.fps is None:
+            return True
+        now = time()
+        if self._next_step is None or now - self._next_step > 1 / self.fps:
+            # first step, or fell behind by more than a step: restart the schedule
+            self._next_step = now
+        if now < self._next_step:
+            return False
+        self._next_step += 1 / self.fps
+        return True
+
     def update_display(self):
+        if self.viewport is not None:
+            self.viewport.set_focus(self.model.snake.head.current_position)
         self.board.render(self.model.board)
+        self._window_frames += 1
+        if self.hud is not None:
+            self.update_hud()
+            self.hud.render(self.window)
         pygame.display.update()
 
+    def update_hud(self):
+        now = time()
+        elapsed = now - self._window_start
+        if elapsed >= 1:
+            self.steps_per_second = round(self._window_steps / elapsed)
+            self.render_fps = round(self._window_frames / elapsed)
+            self._window_start = now
+            self._window_steps = 0
+            self._window_frames = 0
+        agent = self.model.agent
+        epsilon = getattr(agent, "epsilon", None)
+        train_time = getattr(agent, "last_train_time", None)
+        queue_wait = self.input_queue.last_wait
+        self.hud.update(
+            {
+                "steps/s": self.steps_per_second,
+                "fps": self.render_fps,
+                "episode": self.model.iteration_num,
+                "score": self.model.snake.length,
+                "high score": self.model.high_score,
+                "epsilon": None if epsilon is None else f"{epsilon:.2f}",
+                "train step": (
+                    None if train_time is None else f"{train_time * 1000:.0f} ms"
+                ),
+                "queue wait": (
+                    None if queue_wait is None else f"{queue_wait * 1000:.0f} ms"
+                ),
+            }
+        )
+
     def paint_board(self):
         pass
 
@@ -95,10 +190,13 @@ class InputFrame:
 
 class SimulatorModel:
 
-    def __init__(self, width, height, agent, max_iterations, debug=True):
+    def __init__(
+        self, width, height, agent, max_iterations, debug=True, snapshot_every=None
+    ):
         """
         Keeps track of simulation domain
         - Goal is to be able to run the simulator headless (without a GUI)
+        :param snapshot_every: save a full training snapshot every n iterations (episodes)
         """
         self.num_channels = 1
         self.input_shape = (width, height, self.num_channels)
@@ -108,6 +206,7 @@ class SimulatorModel:
         self.width = width
         self.height = height
         self.agent = agent
+        self._debug = debug
         # board consists of width, height, and one color channel
         self.board = np.zeros(self.input_shape)
         self.snake = self.initialize_snake()
@@ -118,10 +217,11 @@ class SimulatorModel:
         self.max_iterations = max_iterations
         self.scores = []
 
-        self._debug = debug
         # A queue holding the last 4 (m) states
         self.input_frame = InputFrame(input_shape=self.input_shape, m=4)
         self.iteration_num = 1
+        self.snapshot_every = snapshot_every
+        self._last_snapshot = self.iteration_num
 
     def initialize_simulation(self):
         self.generate_board()
@@ -187,8 +287,69 @@ class SimulatorModel:
             self.food = self.generate_food_position()
         # refresh the food_position
         self.board[self.food[0], self.food[1]] = FOOD_COLOR
+        self.handle_snapshot()
         return self.iteration_num == self.max_iterations
 
+    def handle_snapshot(self):
+        if (
+            self.snapshot_every
+            and self.iteration_num != self._last_snapshot
+            and self.iteration_num % self.snapshot_every == 0
+        ):
+            self._last_snapshot = self.iteration_num
+            save_snapshot(self)
+
+    def get_training_state(self):
+        """
+        - Board, snake, food, frame history and stats as arrays plus json-able metadata
+        :return: (arrays, meta)
+        """
+        cells = list(self.snake.cells())
+        has_previous = np.array([c.previous_position is not None for c in cells])
+        arrays = {
+            "board": self.board,
+            "food": self.food,
+            "snake_positions": np.array([c.current_position for c in cells]),
+            "snake_previous": np.array(
+                [
+                    c.previous_position if c.previous_position is not None else (0, 0)
+                    for c in cells
+                ]
+            ),
+            "snake_has_previous": has_previous,
+            "scores": np.array(self.scores, dtype=np.int64),
+        }
+        if self.input_frame.inputs:
+            arrays["input_frames"] = np.stack(self.input_frame.inputs)
+        meta = {
+            "iteration_num": self.iteration_num,
+            "high_score": self.high_score,
+            "snake_direction": int(self.snake.current_direction),
+        }
+        return arrays, meta
+
+    def set_training_state(self, arrays, meta):
+        self.board = arrays["board"].copy()
+        self.food = arrays["food"].copy()
+        self.snake.restore(
+            positions=arrays["snake_positions"],
+            previous_positions=[
+                p if has else None
+                for p, has in zip(
+                    arrays["snake_previous"], arrays["snake_has_previous"]
+                )
+            ],
+            direction=meta["snake_direction"],
+        )
+        self.input_frame.clear()
+        if "input_frames" in arrays:
+            self.input_frame.inputs.extend(frame for frame in arrays["input_frames"])
+        self.scores = arrays["scores"].tolist()
+        self.iteration_num = meta["iteration_num"]
+        self.high_score = meta["high_score"]
+        # the snapshot being resumed from is not written again
+        self._last_snapshot = self.iteration_num
+
     def reset(self):
         score = self.snake.reset()
         # clear the inputs to start fresh
@@ -236,4 +397,5 @@ class SimulatorModel:
         )
 
     def handle_close_event(self):
+        self.agent.close()
         self.agent.save_model("latest.weights.h5")
@@ -49,7 +49,7 @@ class SnakeCell:
             return
         # clear the position on the board where we were
         if (
-            self.previous_position[0] < board.shape[1]
+            self.previous_position[0] < board.shape[0]
             and self.previous_position[1] < board.shape[1]
         ):
             board[self.previous_position[0], self.previous_position[1]] = 0
@@ -114,6 +114,40 @@ class Snake:
         if direction == "down":
             return 3
 
+    def cells(self):
+        """
+        - SnakeCells from head to tail
+        """
+        cell = self.head
+        while cell is not None:
+            yield cell
+            cell = cell.tail
+
+    def restore(self, positions, previous_positions, direction):
+        """
+        - Rebuild the cell chain, e.g. from a snapshot
+        :param positions: positions from head to tail
+        :param previous_positions: matching previous positions (None where unset)
+        :param direction: current direction
+        """
+        self.head.die()
+        self.head = None
+        cell = None
+        for position, previous in zip(positions, previous_positions):
+            new_cell = SnakeCell(
+                next_cell=cell, position=np.array(position), head_cell=cell is None
+            )
+            new_cell.previous_position = (
+                None if previous is None else np.array(previous)
+            )
+            if cell is None:
+                self.head = new_cell
+            else:
+                cell.tail = new_cell
+            cell = new_cell
+        self.length = len(positions)
+        self.current_direction = direction
+
     def eat(self):
         self.length += 1
         self.head.add_cell()
@@ -0,0 +1,94 @@
+import numpy as np
+import json
+import os
+import re
+import shutil
+import time
+import logging
+
+log = logging.getLogger(__name__)
+
+SNAPSHOT_DIR = os.path.join("src", "assets", "snapshots")
+_SNAPSHOT_NAME = re.compile(r"^snapshot_(\d+)$")
+
+
+def save_snapshot(model, directory=SNAPSHOT_DIR, keep=3):
+    """
+    - Write the full training state of a SimulatorModel and its agent
+    - Arrays go into an uncompressed npz (raw array copies, no pickling), scalars and RNG
+      bookkeeping into meta.json
+    - The snapshot is written to a temporary directory and renamed, so a crash mid-write
+      never leaves a half written "latest" snapshot behind
+    :param model: SimulatorModel whose agent implements get_training_state
+    :param directory: parent directory of all snapshots
+    :param keep: number of most recent snapshots to keep (None keeps all)
+    :return: path of the new snapshot
+    """
+    start = time.perf_counter()
+    agent_arrays, agent_meta = model.agent.get_training_state()
+    model_arrays, model_meta = model.get_training_state()
+    rng_name, rng_keys, rng_pos, rng_has_gauss, rng_gauss = np.random.get_state()
+    arrays = {"rng.keys": rng_keys}
+    arrays.update({f"agent.{key}": value for key, value in agent_arrays.items()})
+    arrays.update({f"model.{key}": value for key, value in model_arrays.items()})
+    meta = {
+        "agent": agent_meta,
+        "model": model_meta,
+        "rng": [rng_name, rng_pos, rng_has_gauss, rng_gauss],
+    }
+
+    path = os.path.join(directory, f"snapshot_{model.iteration_num:08d}")
+    tmp_path = path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    np.savez(os.path.join(tmp_path, "arrays.npz"), **arrays)
+    with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+        json.dump(meta, f)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    log.info(f"Saved snapshot {path} in {time.perf_counter() - start:.2f}s")
+
+    if keep is not None:
+        for old in list_snapshots(directory)[:-keep]:
+            shutil.rmtree(old, ignore_errors=True)
+    return path
+
+
+def list_snapshots(directory=SNAPSHOT_DIR):
+    """
+    :return: snapshot paths, oldest first
+    """
+    if not os.path.isdir(directory):
+        return []
+    names = [name for name in os.listdir(directory) if _SNAPSHOT_NAME.match(name)]
+    names.sort(key=lambda name: int(_SNAPSHOT_NAME.match(name).group(1)))
+    return [os.path.join(directory, name) for name in names]
+
+
+def latest_snapshot(directory=SNAPSHOT_DIR):
+    snapshots = list_snapshots(directory)
+    return snapshots[-1] if snapshots else None
+
+
+def load_snapshot(model, path):
+    """
+    - Restore a SimulatorModel and its agent from save_snapshot output
+    """
+    start = time.perf_counter()
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    with np.load(os.path.join(path, "arrays.npz"), allow_pickle=False) as data:
+        arrays = {key: data[key] for key in data.files}
+    model.agent.set_training_state(
+        {k[len("agent.") :]: v for k, v in arrays.items() if k.startswith("agent.")},
+        meta["agent"],
+    )
+    model.set_training_state(
+        {k[len("model.") :]: v for k, v in arrays.items() if k.startswith("model.")},
+        meta["model"],
+    )
+    rng_name, rng_pos, rng_has_gauss, rng_gauss = meta["rng"]
+    np.random.set_state(
+        (rng_name, arrays["rng.keys"], rng_pos, rng_has_gauss, rng_gauss)
+    )
+    log.info(f"Resumed from snapshot {path} in {time.perf_counter() - start:.2f}s")
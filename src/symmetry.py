@@ -0,0 +1,81 @@
+from gamestate import DIRECTIONS
+import numpy as np
+
+# dihedral group of the board as (transpose, flip_x, flip_y), transposing first
+TRANSFORMS = tuple(
+    (transpose, flip_x, flip_y)
+    for transpose in (False, True)
+    for flip_x in (False, True)
+    for flip_y in (False, True)
+)
+
+
+def symmetry_transforms(width, height):
+    """
+    - All 8 rotations/reflections for square boards, the 4 that keep the shape otherwise
+    """
+    return [t for t in TRANSFORMS if width == height or not t[0]]
+
+
+def transform_boards(boards, transform):
+    """
+    :param boards: array whose last two axes are x and y
+    :param transform: (transpose, flip_x, flip_y)
+    :return: transformed view
+    """
+    transpose, flip_x, flip_y = transform
+    if transpose:
+        boards = np.swapaxes(boards, -1, -2)
+    if flip_x:
+        boards = boards[..., ::-1, :]
+    if flip_y:
+        boards = boards[..., ::-1]
+    return boards
+
+
+def action_map(transform):
+    """
+    - mapping[a] is action a seen through the transform, worked out by moving a marker
+      one step from the centre of a 3 x 3 board
+    """
+    mapping = np.empty(len(DIRECTIONS), dtype=np.int64)
+    for action, (dx, dy) in enumerate(DIRECTIONS):
+        marker = np.zeros((3, 3))
+        marker[1 + dx, 1 + dy] = 1
+        x, y = np.argwhere(transform_boards(marker, transform))[0]
+        mapping[action] = DIRECTIONS.index((int(x) - 1, int(y) - 1))
+    return mapping
+
+
+def transform_states(states, transform, frames):
+    """
+    - Apply a transform to every frame of a batch of stacked states at once
+    :param states: (batch, width, frames * height, channels), frames side by side on axis 2
+    :param frames: frames per state
+    """
+    batch, width, stacked, channels = states.shape
+    # (batch, channels, frame, x, y)
+    boards = states.reshape(batch, width, frames, stacked // frames, channels)
+    boards = transform_boards(boards.transpose(0, 4, 2, 1, 3), transform)
+    width, height = boards.shape[-2:]
+    return boards.transpose(0, 3, 2, 4, 1).reshape(
+        batch, width, frames * height, channels
+    )
+
+
+def augment_batch(states, actions, next_states, frames):
+    """
+    - Every symmetric copy of a batch of transitions, identity first
+    :param states: (batch, width, frames * height, channels)
+    :param actions: (batch,) int actions 0 - 3
+    :param next_states: like states
+    :return: (states, actions, next_states, copies) with copies * batch rows each
+    """
+    width, height = states.shape[1], states.shape[2] // frames
+    transforms = symmetry_transforms(width, height)
+    return (
+        np.concatenate([transform_states(states, t, frames) for t in transforms]),
+        np.concatenate([action_map(t)[actions] for t in transforms]),
+        np.concatenate([transform_states(next_states, t, frames) for t in transforms]),
+        len(transforms),
+    )
@@ -0,0 +1,41 @@
+from arena import Arena, EMPTY
+import numpy as np
+
+
+def _place(arena, cells, directions):
+    """
+    - Replace every snake with a length 1 snake at cells[i] (x, y) facing directions[i]
+    """
+    arena._clear(arena._ids)
+    arena._food[:] = False
+    flat = np.array(
+        [(x + arena._pad) * arena._padded_height + y + arena._pad for x, y in cells]
+    )
+    arena.heads[:] = flat
+    arena.directions[:] = directions
+    arena.lengths[:] = 1
+    arena._ptr[:] = 0
+    arena._bodies[:, 0] = flat
+    arena._occupancy[flat] = arena._ids + 1
+
+
+def test_head_on_swap_kills_both_snakes():
+    np.random.seed(0)
+    arena = Arena(6, 3, num_snakes=2, num_food=1, view_radius=1)
+    # A at (2, 1) moving right, B at (3, 1) moving left
+    _place(arena, [(2, 1), (3, 1)], [2, 0])
+    _, rewards, dones = arena.step([4, 4])
+    assert dones.tolist() == [True, True]
+    assert rewards.tolist() == [arena.snake_collision_value] * 2
+
+
+def test_following_snake_survives():
+    np.random.seed(0)
+    arena = Arena(6, 3, num_snakes=2, num_food=1, view_radius=1)
+    # A follows B into the cell B leaves
+    _place(arena, [(2, 1), (3, 1)], [2, 2])
+    heads = arena.heads.copy()
+    _, _, dones = arena.step([4, 4])
+    assert dones.tolist() == [False, False]
+    assert arena.heads.tolist() == (heads + arena._deltas[2]).tolist()
+    assert arena._occupancy[heads[0]] == EMPTY